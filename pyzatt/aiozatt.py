@@ -0,0 +1,506 @@
+import asyncio
+import datetime
+import struct
+import pyzatt.misc as misc
+import pyzatt.zkmodules.defs as DEFS
+from pyzatt.pyzatt import ZKUser, AttendanceLog
+from pyzatt.zkmodules.packet import HEADER, Packet, PacketMixin
+from pyzatt.zkmodules.terminal import TerminalMixin
+from pyzatt.zkmodules.realtime import decode_event, EventBuffer
+from pyzatt.zkmodules.data_user import decode_fp_entry
+from pyzatt.zkmodules.data_record import ATT_ENTRY, decode_att_entries, \
+    decode_op_entry
+
+"""
+This file contains a session class based on asyncio streams, so a single
+thread may communicate with several devices at the same time, the packets
+are built and parsed with the same functions used by ZKSS.
+"""
+
+
+class AsyncZKSS:
+    """
+    Asyncio session with a device, the commands are coroutines with the
+    same names of the ZKSS methods.
+    """
+    # functions without I/O, shared with ZKSS
+    create_packet = PacketMixin.create_packet
+    pack_packet = PacketMixin.pack_packet
+    parse_ans = PacketMixin.parse_ans
+    recvd_ack = PacketMixin.recvd_ack
+    data_chunk_view = PacketMixin.data_chunk_view
+    check_data_chunk = PacketMixin.check_data_chunk
+    read_status = TerminalMixin.read_status
+
+    def __init__(self, timeout=10.0):
+        """
+        :param timeout: Float, maximum time in seconds to wait for the
+            device on each read or write, if it is None, waits without a
+            limit, asyncio.TimeoutError is raised when it expires.
+        """
+        self.timeout = timeout
+        self.reply_number = 0           # reply counter
+        self.session_id = 0             # session id
+        self.connected_flg = False      # connection flag
+        self.reader = None              # asyncio stream reader
+        self.writer = None              # asyncio stream writer
+        self.users = {}                 # dict of ZKUser, the key is the index
+        self.att_log = AttendanceLog()  # attendance entries
+        self.op_log = []                # list of operation entries
+        self.send_buffer = bytearray(1024)  # reused to build packets
+
+    async def connect_net(self, ip_addr, dev_port):
+        """
+        Connects to the machine and inits session by sending the connect
+        command.
+
+        :param ip_addr: String, ip address of the device.
+        :param dev_port: Int, port number.
+        :return: Bool, returns True if connection is successful.
+        """
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(ip_addr, dev_port), self.timeout)
+
+        # send connect command
+        await self.send_command(DEFS.CMD_CONNECT)
+        await self.recv_reply()
+
+        # sets session id
+        self.session_id = self.last_session_code
+
+        # set SDKBuild variable of the device
+        await self.set_device_info('SDKBuild', '1')
+
+        # check reply code
+        self.connected_flg = self.recvd_ack()
+        return self.connected_flg
+
+    async def disconnect(self):
+        """
+        Terminates connection with the device.
+
+        :return: Bool, returns True if disconnection command was
+            processed successfully.
+        """
+        await self.send_command(DEFS.CMD_EXIT)
+        await self.recv_reply()
+
+        # close connection and update flag
+        self.writer.close()
+        self.connected_flg = False
+
+        return self.recvd_ack()
+
+    async def send_command(self, cmd, data=None):
+        """
+        Sends a packet with a given command.
+
+        :param cmd: Integer, command id.
+        :param data: Bytearray, data to be placed in the data field
+            of the payload.
+        :return: None.
+        """
+        pkt_len = HEADER.size + (len(data) if data else 0)
+        if len(self.send_buffer) < pkt_len:
+            self.send_buffer = bytearray(max(pkt_len,
+                                             2 * len(self.send_buffer)))
+
+        self.pack_packet(self.send_buffer, cmd, data)
+        await self.send_packet(self.send_buffer[:pkt_len])
+
+    async def send_packet(self, zkp):
+        """
+        Sends a given complete packet.
+
+        :param zkp: Bytes-like object, packet to send.
+        :return: None.
+        """
+        self.writer.write(zkp)
+        await asyncio.wait_for(self.writer.drain(), self.timeout)
+
+    async def recv_exact(self, size, wait=False):
+        """
+        Receives a given amount of data from the device.
+
+        :param size: Integer, amount of data to receive.
+        :param wait: Bool, if True, waits without a time limit, otherwise
+            waits up to the timeout of the session.
+        :return: Bytes, received data.
+        """
+        if wait:
+            return await self.reader.readexactly(size)
+        return await asyncio.wait_for(self.reader.readexactly(size),
+                                      self.timeout)
+
+    async def recv_packet(self, wait=False):
+        """
+        Receives exactly one packet from the device.
+
+        :param wait: Bool, if True, waits for the packet without a time
+            limit, e.g. for an event.
+        :return: Bytearray, received packet.
+        """
+        header = await self.recv_exact(8, wait)
+        size = struct.unpack('<H', header[4:6])[0]
+        return bytearray(header + await self.recv_exact(size))
+
+    async def recv_data_chunk(self, dataset, offset=0):
+        """
+        Receives a packet of a large dataset, the payload of a CMD_DATA
+        packet is stored in the given buffer, see
+        ZKSS.recv_data_chunk().
+
+        :param dataset: Bytearray, buffer where the payload is stored.
+        :param offset: Int, position of the buffer where the payload
+            is written.
+        :return: Int, number of bytes written in the dataset, returns -1 if
+            the packet doesn't have a valid CMD_DATA payload.
+        """
+        header = bytearray(await self.recv_exact(HEADER.size))
+        pkt = Packet(header)
+
+        if not pkt.has_valid_tag():
+            # the size field can't be trusted, nothing else is received
+            self.parse_ans(header)
+            return -1
+
+        chunk = self.data_chunk_view(pkt, dataset, offset)
+        if chunk is None:
+            # not a data packet, receive the rest of it and parse it
+            self.parse_ans(header + await self.recv_exact(pkt.data_size))
+            return -1
+
+        chunk[:] = await self.recv_exact(len(chunk))
+        return self.check_data_chunk(pkt, chunk)
+
+    async def recv_reply(self):
+        """
+        Receives a reply and updates the reply number, the fields of the
+        packet are stored as done by parse_ans().
+
+        :return: Bool, returns True if the packet is valid.
+        """
+        valid = self.parse_ans(await self.recv_packet())
+        self.reply_number += 1
+        return valid
+
+    async def recv_long_reply(self):
+        """
+        Receives a large dataset from the device, see ex_data spec.
+
+        :return: Bytearray, received dataset.
+        """
+        await self.recv_reply()
+
+        dataset = bytearray()
+
+        if self.last_reply_code == DEFS.CMD_DATA:
+            # device sent the dataset immediately, i.e. short dataset
+            dataset = bytearray(self._payload_view)
+
+        elif self.last_reply_code == DEFS.CMD_PREPARE_DATA:
+            self.parse_ans(await self.recv_packet())
+            dataset = bytearray(self._payload_view)
+            await self.recv_packet()
+
+        elif self.last_reply_code == DEFS.CMD_ACK_OK:
+            size_info = struct.unpack('<I', self.last_payload_data[1:5])[0]
+
+            # ready for data command, followed by the prepare data reply
+            await self.send_command(DEFS.CMD_DATA_RDY, data=bytearray(
+                struct.pack('<II', 0, size_info)))
+            await self.recv_packet()
+
+            # receives the data packets into a single buffer with the
+            # announced size of the dataset
+            dataset = bytearray(size_info)
+            offset = 0
+            while True:
+                chunk_size = await self.recv_data_chunk(dataset, offset)
+                if chunk_size < 0:
+                    break
+                offset += chunk_size
+
+            # drop the unused space if the device sent less data
+            del dataset[offset:]
+
+            # free data
+            self.reply_number += 1
+            await self.send_command(DEFS.CMD_FREE_DATA)
+            await self.recv_packet()
+            self.reply_number += 1
+
+        return dataset
+
+    async def request_dataset(self, data):
+        """
+        Sends a CMD_DATA_WRRQ command and receives the dataset.
+
+        :param data: Bytearray, data of the read request.
+        :return: Bytearray, received dataset.
+        """
+        await self.send_command(cmd=DEFS.CMD_DATA_WRRQ, data=data)
+        return await self.recv_long_reply()
+
+    async def get_device_info(self, param_name):
+        """
+        Requests a given parameter from the device.
+
+        :param param_name: String, parameters to request.
+        :return: String, the param value.
+        """
+        await self.send_command(DEFS.CMD_OPTIONS_RRQ,
+                                bytearray("{0}\x00".format(param_name),
+                                          'ascii'))
+        await self.recv_reply()
+        return self.last_payload_data.decode('ascii').split('=')[-1]
+
+    async def set_device_info(self, param_name, new_value):
+        """
+        Sets a parameter of the device.
+
+        :param param_name: String, parameter to modify.
+        :param new_value: String, the new value of the parameters.
+        :return: Bool, returns True if the commands were
+            processed successfully.
+        """
+        await self.send_command(DEFS.CMD_OPTIONS_WRQ, bytearray(
+            "{0}={1}\x00".format(param_name, new_value), 'ascii'))
+        await self.recv_reply()
+        ack1 = self.recvd_ack()
+        await self.send_command(DEFS.CMD_REFRESHOPTION)
+        await self.recv_reply()
+        return ack1 and self.recvd_ack()
+
+    async def get_serial_number(self):
+        """
+        Returns the serial number of the device.
+
+        :return: String, serial number.
+        """
+        return await self.get_device_info("~SerialNumber")
+
+    async def get_device_time(self):
+        """
+        Requests and returns the decoded time of the device.
+
+        :return: Datetime object, datetime of the device.
+        """
+        await self.send_command(DEFS.CMD_GET_TIME)
+        await self.recv_reply()
+        return misc.decode_time(self.last_payload_data)
+
+    async def set_device_time(self, t=None):
+        """
+        Sets the time of the device.
+
+        :param t: Datetime object, new time of the device, if not specified,
+            it defaults to current time.
+        :return: Bool, returns True if set time command was
+            processed successfully.
+        """
+        if t is None:
+            t = datetime.datetime.now()
+        await self.send_command(DEFS.CMD_SET_TIME, data=misc.encode_time(t))
+        await self.recv_reply()
+        return self.recvd_ack()
+
+    async def get_device_status(self, stat_keys):
+        """
+        Requests the status structure of the device and returns the status
+        values in the given dictionary, see ZKSS.get_device_status().
+
+        :param stat_keys: Dictionary, with the keys to request.
+        :return: Dictionary, the output is given on the same input dict.
+        """
+        await self.send_command(DEFS.CMD_GET_FREE_SIZES)
+        await self.recv_reply()
+        self.dev_status = self.last_payload_data
+
+        for k in stat_keys:
+            try:
+                stat_keys[k] = self.read_status(DEFS.STATUS[k])
+            except struct.error:
+                print("Failed to read field: {0}".format(k))
+                stat_keys[k] = -1
+        return stat_keys
+
+    async def enable_device(self):
+        """
+        Enables the device, puts the machine in normal operation.
+
+        :return: Bool, returns True if the device acknowledges
+            the enable command.
+        """
+        await self.send_command(DEFS.CMD_ENABLEDEVICE)
+        await self.recv_reply()
+        return self.recvd_ack()
+
+    async def disable_device(self):
+        """
+        Disables the device, an enable command must be send to make the
+        device return to normal operation.
+
+        :return: Bool, returns True if the device acknowledges
+            the disable command.
+        """
+        await self.send_command(DEFS.CMD_DISABLEDEVICE)
+        await self.recv_reply()
+        return self.recvd_ack()
+
+    async def refresh_data(self):
+        """
+        Refresh data on device (fingerprints, user info and settings).
+
+        :return: None.
+        """
+        await self.send_command(cmd=DEFS.CMD_REFRESHDATA)
+        await self.recv_reply()
+
+    async def read_all_user_id(self):
+        """
+        Requests all the users info, except the fingerprint templates.
+
+        :return: None. Stores the users in the users attribute.
+        """
+        dataset = await self.request_dataset(
+            bytearray.fromhex('0109000500000000000000'))
+
+        self.users = {}
+        for user_entry in misc.iter_records([dataset], 72):
+            user = ZKUser(bytes(user_entry))
+            self.users[user.user_sn] = user
+
+    async def read_all_fptmp(self):
+        """
+        Requests all the fingerprint templates.
+
+        :return: None. Stores the templates in the corresponding users.
+        """
+        dataset = await self.request_dataset(
+            bytearray.fromhex('0107000200000000000000'))
+
+        for fp_entry in misc.iter_records([dataset]):
+            user_sn, fp_idx, fp_tmp, fp_flg = decode_fp_entry(fp_entry)
+            if user_sn in self.users:
+                self.users[user_sn].set_user_fptmp(fp_idx, fp_tmp, fp_flg)
+
+    async def upload_user_info(self, user):
+        """
+        Uploads a user's info, the user is stored in the users attribute.
+
+        :param user: ZKUser, user to upload, the user index must be set.
+        :return: Bool, returns True if the device acknowledged the user.
+        """
+        self.users[user.user_sn] = user
+        await self.send_command(cmd=DEFS.CMD_USER_WRQ, data=user.ser_user())
+        await self.recv_reply()
+        ack = self.recvd_ack()
+        await self.refresh_data()
+        return ack
+
+    async def read_att_log(self):
+        """
+        Requests the attendance log.
+
+        :return: None. Stores the attendance log entries
+            in the att_log attribute.
+        """
+        dataset = await self.request_dataset(
+            bytearray.fromhex('010d000000000000000000'))
+
+        self.att_log = AttendanceLog()
+        for block in misc.iter_record_blocks([dataset], ATT_ENTRY.size):
+            self.att_log.extend_raw(decode_att_entries(block))
+
+    async def read_op_log(self):
+        """
+        Requests the operation log.
+
+        :return: None. Stores the operation log in the op_log attribute.
+        """
+        dataset = await self.request_dataset(
+            bytearray.fromhex('0122000000000000000000'))
+
+        self.op_log = [decode_op_entry(op_entry)
+                       for op_entry in misc.iter_records([dataset], 16)]
+
+    async def enable_realtime(self, ef_mask=0xffff):
+        """
+        Sends command to enable realtime events.
+
+        :param ef_mask: Integer, mask of the events to report, see
+            ZKSS.enable_realtime().
+        :return: None.
+        """
+        await self.send_command(cmd=DEFS.CMD_REG_EVENT,
+                                data=bytearray(struct.pack('<I', ef_mask)))
+        await self.recv_reply()
+
+    async def events(self, ef_mask=0xffff, maxsize=64, overflow='block'):
+        """
+        Enables the realtime events and gives them as they arrive, the
+        events are received by a task and kept in a bounded buffer, the
+        session shouldn't be used for other commands while iterating.
+
+        :param ef_mask: Integer, mask of the events to report, other events
+            are ignored.
+        :param maxsize: Integer, maximum number of queued events.
+        :param overflow: String, overflow policy of the buffer, 'block',
+            'drop_oldest' or 'coalesce', see EventBuffer.
+        :return: Async generator of event objects, see decode_event().
+        """
+        buffer = EventBuffer(maxsize, overflow)
+        await self.enable_realtime(ef_mask)
+        cond = asyncio.Condition()
+
+        async def receive():
+            try:
+                while True:
+                    event = await self.recv_event()
+                    if not self.last_event_code & ef_mask:
+                        continue
+                    async with cond:
+                        # with the block policy, wait for the consumer
+                        while not buffer.push(event):
+                            await cond.wait()
+                        cond.notify_all()
+            finally:
+                async with cond:
+                    cond.notify_all()
+
+        receiver = asyncio.ensure_future(receive())
+        try:
+            while True:
+                async with cond:
+                    while not len(buffer) and not receiver.done():
+                        await cond.wait()
+                    if not len(buffer):
+                        break
+                    event = buffer.pop()
+                    cond.notify_all()
+                yield event
+            # the receiver stopped, raise its error
+            receiver.result()
+        finally:
+            if not receiver.done():
+                receiver.cancel()
+                try:
+                    await receiver
+                except asyncio.CancelledError:
+                    pass
+
+    async def recv_event(self):
+        """
+        Receives an event from the machine and sends an acknowledge reply.
+
+        :return: Event object, decoded event, see realtime.decode_event(),
+            it's also stored in the last_event attribute.
+        """
+        self.parse_ans(await self.recv_packet(wait=True))
+        self.last_event_code = self.last_session_code
+        await self.send_packet(self.create_packet(DEFS.CMD_ACK_OK,
+                                                  reply_number=0))
+        self.last_event = decode_event(self.last_event_code,
+                                       self._payload_view)
+        return self.last_event
@@ -0,0 +1,206 @@
+import datetime
+import mmap
+import os
+import struct
+import pyzatt.misc as misc
+from pyzatt.pyzatt import ATTen, AttendanceLog
+from pyzatt.zkmodules.data_record import ATT_ENTRY, decode_att_entries
+
+"""
+This file contains an archive format for attendance entries, the entries
+are stored with the 40 bytes layout used by the device, after a small
+header, so the archive can be read with mmap without decoding every entry.
+"""
+
+# archive header: magic, version and entry size
+ARCHIVE_HEADER = struct.Struct('<4sHH8x')
+ARCHIVE_MAGIC = b'ZKAT'
+ARCHIVE_VERSION = 1
+
+# position of the encoded time in the attendance entry
+ATT_TIME = struct.Struct('<I')
+ATT_TIME_OFFSET = 27
+
+
+class AttArchive:
+    """
+    Append-only file of attendance entries, the entries should be appended
+    in chronological order, so they can be searched by time.
+    """
+    def __init__(self, path):
+        """
+        :param path: String, path of the archive file, it is created if it
+            doesn't exist.
+        """
+        self.path = path
+        self.mm = None
+
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, 'wb') as f:
+                f.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION,
+                                            ATT_ENTRY.size))
+        else:
+            with open(path, 'rb') as f:
+                magic, version, entry_size = ARCHIVE_HEADER.unpack(
+                    f.read(ARCHIVE_HEADER.size))
+            if magic != ARCHIVE_MAGIC or entry_size != ATT_ENTRY.size:
+                raise ValueError("Invalid attendance archive: " + path)
+
+        self.remap()
+
+    def remap(self):
+        """
+        Maps the archive file in memory, it must be used if the file is
+        modified by other archive instance.
+
+        :return: None.
+        """
+        self.unmap()
+
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size > ARCHIVE_HEADER.size:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def unmap(self):
+        """
+        Drops the map of the archive file, if there are views of the map in
+        use, e.g. by iter_raw(), the map is closed once they are released.
+
+        :return: None.
+        """
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                pass
+            self.mm = None
+
+    def close(self):
+        """
+        Unmaps the archive file.
+
+        :return: None.
+        """
+        self.unmap()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, att_log):
+        """
+        Appends attendance entries at the end of the archive.
+
+        :param att_log: AttendanceLog, entries to append.
+        :return: None.
+        """
+        block = bytearray(ATT_ENTRY.size * len(att_log))
+        for i, entry in enumerate(zip(att_log.user_sns, att_log.user_ids,
+                                      att_log.ver_types, att_log.att_times,
+                                      att_log.ver_states)):
+            user_sn, user_id, ver_type, att_time, ver_state = entry
+            ATT_ENTRY.pack_into(block, i * ATT_ENTRY.size, user_sn,
+                                user_id.encode('ascii'), ver_type, att_time,
+                                ver_state)
+
+        with open(self.path, 'ab') as f:
+            f.write(block)
+        self.remap()
+
+    def __len__(self):
+        if self.mm is None:
+            return 0
+        return (len(self.mm) - ARCHIVE_HEADER.size) // ATT_ENTRY.size
+
+    def entries_view(self, start=0, stop=None):
+        """
+        Gives a view of the entries in the archive, without copying them.
+
+        :param start: Integer, position of the first entry.
+        :param stop: Integer, position after the last entry, if it is None,
+            the view ends at the last entry.
+        :return: Memoryview, with whole 40 bytes entries, it keeps the
+            map open until it is released.
+        """
+        if stop is None or stop > len(self):
+            stop = len(self)
+        if self.mm is None or start >= stop:
+            return memoryview(b'')
+        return memoryview(self.mm)[
+            ARCHIVE_HEADER.size + start * ATT_ENTRY.size:
+            ARCHIVE_HEADER.size + stop * ATT_ENTRY.size]
+
+    def att_time(self, idx):
+        """
+        Reads the encoded time of an entry.
+
+        :param idx: Integer, position of the entry.
+        :return: Integer, encoded time, see misc.decode_time_value().
+        """
+        return ATT_TIME.unpack_from(
+            self.mm, ARCHIVE_HEADER.size + idx * ATT_ENTRY.size +
+            ATT_TIME_OFFSET)[0]
+
+    def bisect(self, att_time):
+        """
+        Finds the position of the first entry not older than a given time,
+        with a binary search.
+
+        :param att_time: Integer or datetime object, the integers are taken
+            as encoded times.
+        :return: Integer, position of the entry, the number of entries if
+            every entry is older.
+        """
+        if isinstance(att_time, datetime.datetime):
+            att_time = misc.encode_time_value(att_time)
+
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.att_time(mid) < att_time:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def iter_raw(self, start=None, end=None):
+        """
+        Iterates through the entries in a time range, the entries are
+        decoded one by one, from the mapped file.
+
+        :param start: Datetime object or encoded time, start of the range,
+            if it is None, starts at the first entry.
+        :param end: Datetime object or encoded time, end of the range (not
+            included), if it is None, ends at the last entry.
+        :return: Generator of tuples (user_sn, user_id, ver_type, att_time,
+            ver_state), where att_time is the encoded time.
+        """
+        first = 0 if start is None else self.bisect(start)
+        last = len(self) if end is None else self.bisect(end)
+
+        view = self.entries_view(first, last)
+        try:
+            for entry in decode_att_entries(view):
+                yield entry
+        finally:
+            view.release()
+
+    def __iter__(self):
+        for user_sn, user_id, ver_type, att_time, ver_state in \
+                self.iter_raw():
+            yield ATTen(user_sn, user_id, ver_type,
+                        misc.decode_time_value(att_time), ver_state)
+
+    def read_range(self, start=None, end=None):
+        """
+        Reads the entries in a time range.
+
+        :param start: Datetime object or encoded time, see iter_raw().
+        :param end: Datetime object or encoded time, see iter_raw().
+        :return: AttendanceLog.
+        """
+        att_log = AttendanceLog()
+        att_log.extend_raw(self.iter_raw(start, end))
+        return att_log
@@ -0,0 +1,254 @@
+import asyncio
+import collections
+import concurrent.futures
+from pyzatt.pyzatt import ZKSS
+from pyzatt.aiozatt import AsyncZKSS
+
+"""
+This file contains the managers of groups of devices, they run the same
+operation on every device in parallel, through a pool of threads or
+asyncio tasks, and collect the results and errors of each device.
+"""
+
+# result of an operation on a device, error is None if it succeeded
+FleetResult = collections.namedtuple('FleetResult', ['value', 'error'])
+
+
+class ZKFleet:
+    """
+    Group of ZKSS sessions, the operations run in a thread pool.
+    """
+    def __init__(self, devices, max_workers=16, timeout=10.0):
+        """
+        :param devices: Iterable of tuples (ip_addr, dev_port), the tuples
+            are used as keys of the sessions and results.
+        :param max_workers: Integer, maximum number of devices accessed at
+            the same time.
+        :param timeout: Float, maximum time in seconds to wait for each
+            reply of a device, it's set as the timeout of the sockets, if it
+            is None, waits without a limit.
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.sessions = collections.OrderedDict(
+            (device, ZKSS()) for device in devices)
+
+    def run(self, operation, *args, **kwargs):
+        """
+        Runs an operation on every session.
+
+        :param operation: String or callable, name of the ZKSS method to
+            call, or a function that takes the session as first argument.
+        :param args: Arguments of the operation.
+        :param kwargs: Keyword arguments of the operation.
+        :return: Dictionary, with the devices as keys and FleetResult as
+            values, the exceptions raised by the operation are stored in the
+            error field.
+        """
+        if callable(operation):
+            return self.run_each(
+                lambda zk, device: operation(zk, *args, **kwargs))
+        return self.run_each(
+            lambda zk, device: getattr(zk, operation)(*args, **kwargs))
+
+    def run_each(self, operation, timeout=None):
+        """
+        Runs an operation on every session, the device is also given to
+        the operation.
+
+        :param operation: Callable, function that takes the session and
+            the device tuple as arguments.
+        :param timeout: Float, maximum time in seconds to wait for each
+            reply, if it is None, the timeout of the fleet is used, a device
+            that doesn't reply in time gets a socket.timeout error.
+        :return: Dictionary of FleetResult, see run().
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        def call(zk, device):
+            if getattr(zk, 'soc_zk', None) is not None:
+                zk.soc_zk.settimeout(timeout)
+            return operation(zk, device)
+
+        results = collections.OrderedDict()
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as ex:
+            futures = collections.OrderedDict(
+                (device, ex.submit(call, zk, device))
+                for device, zk in self.sessions.items())
+            for device, future in futures.items():
+                try:
+                    results[device] = FleetResult(future.result(), None)
+                except Exception as e:
+                    results[device] = FleetResult(None, e)
+        return results
+
+    def connect(self):
+        """
+        Connects to every device.
+
+        :return: Dictionary of FleetResult, see run().
+        """
+        return self.run_each(lambda zk, device: zk.connect_net(
+            *device, timeout=self.timeout))
+
+    def disconnect(self):
+        """
+        Disconnects every device.
+
+        :return: Dictionary of FleetResult, see run().
+        """
+        return self.run('disconnect')
+
+    def read_att_log(self):
+        """
+        Reads the attendance log of every device.
+
+        :return: Dictionary of FleetResult, with the AttendanceLog of each
+            device as value.
+        """
+        return self.run(lambda zk: zk.read_att_log() or zk.att_log)
+
+    def read_all_user_id(self):
+        """
+        Reads the users of every device.
+
+        :return: Dictionary of FleetResult, with the users dict of each
+            device as value.
+        """
+        return self.run(lambda zk: zk.read_all_user_id() or zk.users)
+
+    def set_device_time(self, t):
+        """
+        Sets the time of every device.
+
+        :param t: Datetime object, new time of the devices.
+        :return: Dictionary of FleetResult, see run().
+        """
+        return self.run('set_device_time', t)
+
+    def set_user_info(self, user_id, **user_info):
+        """
+        Sets a user's info on every device, the users of the devices must
+        be read first, so the index of the user is found on each device.
+
+        :param user_id: String, user's ID.
+        :param user_info: Keyword arguments, see ZKSS.set_user_info().
+        :return: Dictionary of FleetResult, see run().
+        """
+        return self.run('set_user_info', user_id, **user_info)
+
+
+class AsyncZKFleet:
+    """
+    Group of AsyncZKSS sessions, the operations run as asyncio tasks, the
+    number of devices accessed at the same time is limited by a semaphore.
+    """
+    def __init__(self, devices, limit=64, timeout=60.0):
+        """
+        :param devices: Iterable of tuples (ip_addr, dev_port), the tuples
+            are used as keys of the sessions and results.
+        :param limit: Integer, maximum number of devices accessed at the
+            same time.
+        :param timeout: Float, maximum time in seconds of an operation on
+            each device, if it is None, waits without a limit.
+        """
+        self.limit = limit
+        self.timeout = timeout
+        self.sessions = collections.OrderedDict(
+            (device, AsyncZKSS()) for device in devices)
+
+    async def run(self, operation, *args, **kwargs):
+        """
+        Runs an operation on every session.
+
+        :param operation: String or coroutine function, name of the
+            AsyncZKSS method to call, or a function that takes the session
+            as first argument.
+        :param args: Arguments of the operation.
+        :param kwargs: Keyword arguments of the operation.
+        :return: Dictionary of FleetResult, see ZKFleet.run().
+        """
+        if callable(operation):
+            return await self.run_each(
+                lambda zk, device: operation(zk, *args, **kwargs))
+        return await self.run_each(
+            lambda zk, device: getattr(zk, operation)(*args, **kwargs))
+
+    async def run_each(self, operation, timeout=None):
+        """
+        Runs an operation on every session, the device is also given to
+        the operation.
+
+        :param operation: Coroutine function, that takes the session and
+            the device tuple as arguments.
+        :param timeout: Float, maximum time in seconds of the operation on
+            each device, if it is None, the timeout of the fleet is used, a
+            device that doesn't finish in time gets an asyncio.TimeoutError.
+        :return: Dictionary of FleetResult, see ZKFleet.run().
+        """
+        if timeout is None:
+            timeout = self.timeout
+        semaphore = asyncio.Semaphore(self.limit)
+
+        async def call(zk, device):
+            async with semaphore:
+                try:
+                    return FleetResult(await asyncio.wait_for(
+                        operation(zk, device), timeout), None)
+                except Exception as e:
+                    return FleetResult(None, e)
+
+        values = await asyncio.gather(
+            *[call(zk, device) for device, zk in self.sessions.items()])
+        return collections.OrderedDict(zip(self.sessions, values))
+
+    async def connect(self):
+        """
+        Connects to every device.
+
+        :return: Dictionary of FleetResult, see ZKFleet.run().
+        """
+        return await self.run_each(
+            lambda zk, device: zk.connect_net(*device))
+
+    async def disconnect(self):
+        """
+        Disconnects every device.
+
+        :return: Dictionary of FleetResult, see ZKFleet.run().
+        """
+        return await self.run('disconnect')
+
+    async def read_att_log(self):
+        """
+        Reads the attendance log of every device.
+
+        :return: Dictionary of FleetResult, with the AttendanceLog of each
+            device as value.
+        """
+        async def read(zk):
+            await zk.read_att_log()
+            return zk.att_log
+        return await self.run(read)
+
+    async def read_all_user_id(self):
+        """
+        Reads the users of every device.
+
+        :return: Dictionary of FleetResult, with the users dict of each
+            device as value.
+        """
+        async def read(zk):
+            await zk.read_all_user_id()
+            return zk.users
+        return await self.run(read)
+
+    async def set_device_time(self, t):
+        """
+        Sets the time of every device.
+
+        :param t: Datetime object, new time of the devices.
+        :return: Dictionary of FleetResult, see ZKFleet.run().
+        """
+        return await self.run('set_device_time', t)
@@ -0,0 +1,176 @@
+import collections
+import logging
+import selectors
+import struct
+
+"""
+This file contains an event hub, to receive the realtime events of several
+devices from a single thread, the sockets of the sessions are watched with
+a selector, so a device is only read when it has sent an event.
+"""
+
+logger = logging.getLogger(__name__)
+
+# event received from a session, data is a copy of the event payload and
+# event is the decoded event, see realtime.decode_event()
+HubEvent = collections.namedtuple('HubEvent',
+                                  ['session', 'code', 'data', 'event'])
+
+
+class ZKEventHub:
+    """
+    Receives the realtime events of several ZKSS sessions, the events are
+    acknowledged and dispatched to the callbacks and the queue of the hub.
+    """
+    def __init__(self, queue=None):
+        """
+        :param queue: Queue object, e.g. queue.Queue, where the HubEvent
+            of each received event is put, optional.
+        """
+        self.selector = selectors.DefaultSelector()
+        self.callbacks = []
+        self.queue = queue
+        self.timeouts = {}  # timeouts of the sockets before registering
+
+    def register(self, zk):
+        """
+        Adds a session to the hub, the realtime events should be enabled
+        on the session, see enable_realtime().
+
+        :param zk: ZKSS, connected session, its socket is set to
+            non-blocking mode while it is registered.
+        :return: None.
+        """
+        self.timeouts[zk] = zk.soc_zk.gettimeout()
+        zk.soc_zk.setblocking(False)
+        self.selector.register(zk.soc_zk, selectors.EVENT_READ, zk)
+
+    def unregister(self, zk):
+        """
+        Removes a session from the hub, the previous timeout of its socket
+        is restored.
+
+        :param zk: ZKSS, registered session.
+        :return: None.
+        """
+        self.selector.unregister(zk.soc_zk)
+        try:
+            zk.soc_zk.settimeout(self.timeouts.pop(zk, None))
+        except OSError:
+            pass  # the socket is closed
+
+    def add_callback(self, callback):
+        """
+        Adds a function to be called for each event, the callbacks run on
+        the thread of the hub, right after the event is received, so the
+        parse functions of the session may be used, e.g. parse_alarm_type().
+
+        :param callback: Callable, it takes a HubEvent as argument.
+        :return: None.
+        """
+        self.callbacks.append(callback)
+
+    def sessions(self):
+        """
+        Returns the registered sessions.
+
+        :return: List of ZKSS.
+        """
+        return [key.data for key in self.selector.get_map().values()]
+
+    def poll(self, timeout=None):
+        """
+        Waits for events of any session, receives and dispatches them.
+
+        :param timeout: Float, maximum time to wait in seconds, if it is
+            None, waits until an event is received.
+        :return: Integer, number of received events.
+        """
+        # sessions with events already in the receive buffer
+        ready = [key.data for key in self.selector.get_map().values()
+                 if key.data.recv_buffer.has_packet()]
+        if ready:
+            timeout = 0
+
+        # a single receive for each ready socket, so a device that sent
+        # part of a packet doesn't stall the other devices
+        errors = {}
+        for key, _ in self.selector.select(timeout):
+            zk = key.data
+            try:
+                zk.recv_buffer.fill(zk.soc_zk)
+            except BlockingIOError:
+                continue  # no data yet
+            except OSError as e:
+                errors[zk] = e  # the device closed the connection
+            if zk not in ready:
+                ready.append(zk)
+
+        count = 0
+        for zk in ready:
+            events = []
+            error = errors.get(zk)
+            try:
+                # take the whole burst of events of the session
+                while zk.recv_buffer.has_packet():
+                    event = zk.parse_event(zk.recv_packet())
+                    events.append(HubEvent(zk, zk.last_event_code,
+                                           zk.last_payload_data, event))
+            except (OSError, struct.error) as e:
+                error = e
+
+            # the received events are acknowledged, even if the burst
+            # was broken
+            try:
+                if events:
+                    zk.ack_events(len(events))
+            except OSError as e:
+                error = error or e
+
+            if error is not None:
+                logger.warning("Removing session, failed to receive "
+                               "event: %s", error)
+                self.unregister(zk)
+
+            for event in events:
+                self.dispatch(event)
+            count += len(events)
+        return count
+
+    def dispatch(self, event):
+        """
+        Sends an event to the callbacks and the queue.
+
+        :param event: HubEvent.
+        :return: None.
+        """
+        for callback in self.callbacks:
+            try:
+                callback(event)
+            except Exception:
+                # a failing callback doesn't stop the hub
+                logger.exception("Event callback %r failed", callback)
+        if self.queue is not None:
+            self.queue.put(event)
+
+    def run(self, stop=None, timeout=0.5):
+        """
+        Receives events until the stop flag is set or there aren't any
+        sessions left.
+
+        :param stop: threading.Event object, optional, the hub stops when
+            it is set.
+        :param timeout: Float, time between the checks of the stop flag.
+        :return: None.
+        """
+        while self.selector.get_map() and \
+                (stop is None or not stop.is_set()):
+            self.poll(timeout)
+
+    def close(self):
+        """
+        Closes the selector, the sessions are not disconnected.
+
+        :return: None.
+        """
+        self.selector.close()
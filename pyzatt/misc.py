@@ -1,8 +1,16 @@
+import array
 import binascii
+import functools
 import struct
+import sys
 import datetime
 from colorama import Fore, Style
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 """
 This file contains several functions needed to encode and decode values, some
 functions useful for debugging are also included.
@@ -49,7 +57,8 @@ def is_valid_payload(p):
     Checks if a given packet payload is valid, considering the checksum,
     where the payload is given with the checksum.
 
-    :param p: Bytearray, with the payload contents.
+    :param p: Bytes-like object, with the payload contents, it may be a
+        memoryview of the received packet.
     :return: Bool, if the payload is consistent, returns True,
         otherwise returns False.
     """
@@ -62,6 +71,105 @@ def is_valid_payload(p):
         return False
 
 
+def iter_record_blocks(chunks, record_size, skip=4):
+    """
+    Splits a dataset, received in chunks, into blocks of whole
+    fixed size records, records split across chunks are joined.
+
+    :param chunks: Iterable of bytes-like objects, chunks of the dataset.
+    :param record_size: Int, size of each record.
+    :param skip: Int, number of bytes to skip at the start of the dataset,
+        by default skips the size field of the dataset.
+    :return: Generator of memoryviews, each one with a length multiple of
+        the record size.
+    """
+    pending = bytearray()  # incomplete record from the previous chunk
+    for chunk in chunks:
+        mv = memoryview(chunk).cast('B')
+
+        # skip the dataset header
+        if skip:
+            n = min(skip, len(mv))
+            mv = mv[n:]
+            skip -= n
+
+        # complete the record split across chunks
+        if pending:
+            n = min(record_size - len(pending), len(mv))
+            pending += mv[:n]
+            mv = mv[n:]
+            if len(pending) < record_size:
+                continue
+            yield memoryview(bytes(pending))
+            pending = bytearray()
+
+        # yield the whole records of the chunk without copying them
+        end = len(mv) - len(mv) % record_size
+        if end:
+            yield mv[:end]
+        pending += mv[end:]
+
+
+def iter_records(chunks, record_size=None, skip=4):
+    """
+    Splits a dataset, received in chunks, into records, records split
+    across chunks are joined.
+
+    :param chunks: Iterable of bytes-like objects, chunks of the dataset.
+    :param record_size: Int, size of each record, if it is None the size
+        of each record is read from its first two bytes, e.g. templates.
+    :param skip: Int, number of bytes to skip at the start of the dataset,
+        by default skips the size field of the dataset.
+    :return: Generator of memoryviews, one for each record.
+    """
+    if record_size is not None:
+        for block in iter_record_blocks(chunks, record_size, skip):
+            for i in range(0, len(block), record_size):
+                yield block[i:i + record_size]
+        return
+
+    pending = bytearray()  # incomplete record from the previous chunk
+    for chunk in chunks:
+        mv = memoryview(chunk).cast('B')
+
+        # skip the dataset header
+        if skip:
+            n = min(skip, len(mv))
+            mv = mv[n:]
+            skip -= n
+
+        # complete the record split across chunks, first the size field
+        # and then the rest of the record
+        while pending and len(mv):
+            if len(pending) < 2:
+                pending += mv[:1]
+                mv = mv[1:]
+                continue
+            size = struct.unpack('<H', pending[0:2])[0]
+            if size < 2:
+                print("Invalid record size")
+                return
+            n = min(size - len(pending), len(mv))
+            pending += mv[:n]
+            mv = mv[n:]
+            if len(pending) == size:
+                yield memoryview(bytes(pending))
+                pending = bytearray()
+
+        # yield the whole records of the chunk without copying them
+        i = 0
+        while len(mv) - i >= 2:
+            size = struct.unpack('<H', mv[i:i + 2])[0]
+            if size < 2:
+                print("Invalid record size")
+                return
+            if i + size > len(mv):
+                break
+            yield mv[i:i + size]
+            i += size
+        pending += mv[i:]
+
+
 def decode_time(enc_t_arr):
     """
     Decodes time, as given on ZKTeco get/set time commands.
@@ -69,15 +177,28 @@ def decode_time(enc_t_arr):
     :param enc_t_arr: Bytearray, with the time field stored in little endian.
     :return: Datetime object, with the extracted date.
     """
-    enc_t = struct.unpack('<I', enc_t_arr)[0]  # extracts the time value
-    secs = int(enc_t % 60)  # seconds
-    mins = int((enc_t / 60.) % 60)  # minutes
-    hour = int((enc_t / 3600.) % 24)  # hours
-    day = int(((enc_t / (3600. * 24.)) % 31)) + 1  # day
-    month = int(((enc_t / (3600. * 24. * 31.)) % 12)) + 1  # month
-    year = int((enc_t / (3600. * 24.)) / 365) + 2000  # year
+    enc_t = struct.unpack_from('<I', enc_t_arr)[0]  # extracts the time value
+    return decode_time_value(enc_t)
+
+
+@functools.lru_cache(maxsize=4096)
+def decode_time_value(enc_t):
+    """
+    Decodes time, given the time value as an integer, e.g. as it is
+    unpacked from a log entry, the results are cached, since the same
+    times are repeated on the logs.
+
+    :param enc_t: Integer, encoded time.
+    :return: Datetime object, with the extracted date.
+    """
+    rest, secs = divmod(enc_t, 60)
+    rest, mins = divmod(rest, 60)
+    days, hour = divmod(rest, 24)
+    months, day = divmod(days, 31)
+    year, month = divmod(months, 12)
 
-    return datetime.datetime(year, month, day, hour, mins, secs)
+    return datetime.datetime(year + 2000, month + 1, day + 1,
+                             hour, mins, secs)
 
 
 def encode_time(t):
@@ -88,41 +209,209 @@ def encode_time(t):
     :param t: Datetime object, with the date.
     :return: Bytearray, with the time stored in little endian format.
     """
-    return bytearray(struct.pack('<I',
-                                 ((t.year % 100) * 12 * 31 + (
-                                     (t.month - 1) * 31) + t.day - 1) *
-                                 (24 * 60 * 60) + (
-                                     t.hour * 60 + t.minute) * 60 + t.second
-                                 ))
+    return bytearray(struct.pack('<I', encode_time_value(t)))
+
+
+def encode_time_value(t):
+    """
+    Converts date to specific codification of time used in ZKTeco
+    devices, given as an integer.
+
+    :param t: Datetime object, with the date.
+    :return: Integer, encoded time.
+    """
+    return ((t.year % 100) * 12 * 31 + ((t.month - 1) * 31) + t.day - 1) * \
+        (24 * 60 * 60) + (t.hour * 60 + t.minute) * 60 + t.second
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+
+@functools.lru_cache(maxsize=4096)
+def encoded_day_to_epoch(enc_day):
+    """
+    Converts an encoded day, i.e. an encoded time divided by the seconds
+    of a day, to the seconds since the epoch at the start of the day.
+
+    :param enc_day: Integer, encoded day.
+    :return: Integer, seconds since the epoch.
+    """
+    months, day = divmod(enc_day, 31)
+    year, month = divmod(months, 12)
+    days = datetime.date(year + 2000, month + 1, day + 1).toordinal() - \
+        EPOCH_ORDINAL
+    return days * 86400
+
+
+def decode_times(enc_times, use_numpy=True):
+    """
+    Decodes several encoded times to seconds since the epoch, the times are
+    taken as UTC.
+
+    :param enc_times: Iterable of integers, encoded times, e.g. the
+        att_time column of the attendance log.
+    :param use_numpy: Bool, if numpy is available, the times are decoded in
+        a single vectorized pass.
+    :return: Numpy array of int64 if numpy is used, otherwise an array of
+        signed long long integers from the array module.
+    """
+    if use_numpy and np is not None:
+        return decode_times64(enc_times).astype(np.int64)
+
+    epochs = array.array('q')
+    for enc_t in enc_times:
+        enc_day, secs = divmod(enc_t, 86400)
+        epochs.append(encoded_day_to_epoch(enc_day) + secs)
+    return epochs
+
+
+def decode_times64(enc_times):
+    """
+    Decodes several encoded times to a numpy datetime64 array, numpy is
+    required.
+
+    :param enc_times: Iterable of integers, encoded times.
+    :return: Numpy array of datetime64[s].
+    """
+    enc_times = np.asarray(enc_times, dtype=np.int64)
+    enc_days, secs = np.divmod(enc_times, 86400)
+    months, day = np.divmod(enc_days, 31)
+
+    # months since 2000 to months since 1970
+    dates = (months + 30 * 12).astype('datetime64[M]').astype('datetime64[D]')
+    return (dates + day).astype('datetime64[s]') + secs
+
+
+def encode_times(epochs, use_numpy=True):
+    """
+    Encodes several times given as seconds since the epoch, the inverse of
+    decode_times().
+
+    :param epochs: Iterable of integers, or numpy datetime64 array.
+    :param use_numpy: Bool, if numpy is available, the times are encoded in
+        a single vectorized pass.
+    :return: Numpy array of uint32 if numpy is used, otherwise an array of
+        unsigned integers from the array module.
+    """
+    if use_numpy and np is not None:
+        times = np.asarray(epochs)
+        if not np.issubdtype(times.dtype, np.datetime64):
+            times = times.astype(np.int64).astype('datetime64[s]')
+        times = times.astype('datetime64[s]')
+        days = times.astype('datetime64[D]')
+        months = days.astype('datetime64[M]')
+        secs = (times - days).astype(np.int64)
+        day = (days - months).astype(np.int64)
+        year, month = np.divmod(months.astype(np.int64) + 1970 * 12, 12)
+        return ((((year % 100) * 12 + month) * 31 + day) * 86400 +
+                secs).astype(np.uint32)
+
+    enc_times = array.array('I')
+    for epoch in epochs:
+        enc_times.append(encode_time_value(
+            EPOCH + datetime.timedelta(seconds=int(epoch))))
+    return enc_times
 
 
 def checksum16(payload):
     """
-    Calculates checksum of packet.
+    Calculates checksum of packet, an odd length payload is considered as
+    padded with a zero, the given payload is not modified.
 
-    :param payload: Bytearray, data to which the checksum is going
-        to be applied.
+    :param payload: Bytes-like object, data to which the checksum is going
+        to be applied, a memoryview may be given to avoid copies.
     :return: Int, checksum result given as a number.
     """
+    return Checksum16(payload).digest()
+
+
+def buffer_checksum(data):
+    """
+    Calculates the checksum of the data buffer of the device, as it is
+    assumed to be given on the reply to the CMD_CHECKSUM_BUFFER command,
+    i.e. the sum of the bytes of the buffer, truncated to 32 bits, the
+    algorithm isn't confirmed on a device.
+
+    :param data: Bytes-like object, data sent to the buffer.
+    :return: Int, checksum of the buffer.
+    """
+    return sum(memoryview(data).cast('B')) & 0xFFFFFFFF
 
-    chk_32b = 0  # accumulates short integers to calculate checksum
-    j = 1  # iterates through payload
 
-    # make odd length packet, even
-    if len(payload) % 2 == 1:
-        payload.append(0x00)
+if sys.byteorder == 'little':
+    def sum_words16(mv):
+        """
+        Adds the little endian short integers of a buffer.
 
-    while j < len(payload):
-        # extract short integer, in little endian, from payload
-        num_16b = payload[j - 1] + (payload[j] << 8)
-        # accumulate
-        chk_32b += num_16b
-        j += 2  # increment pointer by 2 bytes
+        :param mv: Memoryview of bytes, with even length.
+        :return: Int, sum of the short integers.
+        """
+        return sum(mv.cast('H'))
+else:
+    def sum_words16(mv):
+        """
+        Adds the little endian short integers of a buffer.
 
-    # adds the two first bytes to the other two bytes
-    chk_32b = (chk_32b & 0xFFFF) + ((chk_32b & 0xFFFF0000) >> 16)
+        :param mv: Memoryview of bytes, with even length.
+        :return: Int, sum of the short integers.
+        """
+        words = array.array('H', mv)
+        words.byteswap()
+        return sum(words)
 
-    # ones complement to get final checksum
-    chk_16b = chk_32b ^ 0xFFFF
 
-    return chk_16b
+class Checksum16:
+    """
+    Incremental checksum calculation, gives the same result as checksum16
+    but the payload may be given in chunks of any length, e.g. as the
+    packets of a dataset are received.
+    """
+    def __init__(self, data=None):
+        """
+        :param data: Bytes-like object, optional first chunk of the payload.
+        """
+        self.acc = 0            # accumulates short integers
+        self.odd_byte = None    # low byte of an incomplete short integer
+        if data is not None:
+            self.update(data)
+
+    def update(self, data):
+        """
+        Adds a chunk of the payload to the checksum.
+
+        :param data: Bytes-like object, chunk of the payload.
+        :return: None.
+        """
+        mv = memoryview(data).cast('B')
+        if not len(mv):
+            return
+
+        # complete the short integer left by the previous chunk
+        if self.odd_byte is not None:
+            self.acc += self.odd_byte + (mv[0] << 8)
+            self.odd_byte = None
+            mv = mv[1:]
+
+        even_len = len(mv) & ~1
+        self.acc += sum_words16(mv[:even_len])
+
+        if even_len != len(mv):
+            self.odd_byte = mv[-1]
+
+    def digest(self):
+        """
+        Returns the checksum of the data given so far, an odd length
+        payload is considered as padded with a zero.
+
+        :return: Int, checksum result given as a number.
+        """
+        chk_32b = self.acc
+        if self.odd_byte is not None:
+            chk_32b += self.odd_byte
+
+        # adds the two first bytes to the other two bytes
+        chk_32b = (chk_32b & 0xFFFF) + ((chk_32b & 0xFFFF0000) >> 16)
+
+        # ones complement to get final checksum
+        return chk_32b ^ 0xFFFF
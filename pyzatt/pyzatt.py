@@ -1,12 +1,17 @@
-from pyzatt.zkmodules.packet import PacketMixin
+from pyzatt.zkmodules.packet import PacketMixin, PacketReader
 from pyzatt.zkmodules.data_user import DataUserMixin
 from pyzatt.zkmodules.data_record import DataRecordMixin
 from pyzatt.zkmodules.terminal import TerminalMixin
 from pyzatt.zkmodules.access import AccessMixin
 from pyzatt.zkmodules.realtime import RealtimeMixin
 from pyzatt.zkmodules.other import OtherMixin
+from pyzatt.zkmodules.cache import CacheMixin
 from prettytable import PrettyTable
+import pyzatt.misc as misc
+import array
 import binascii
+import collections.abc
+import heapq
 import struct
 
 """
@@ -17,23 +22,160 @@ Author: Alexander Marin <alexuzmarin@gmail.com>
 """
 
 
+class FPTemplates(collections.abc.MutableSequence):
+    """
+    List-like view of the fingerprint templates of a user, with an item for
+    each finger index, the items are read from and written to the fptmps
+    dict of the user.
+    """
+    __slots__ = ('user',)
+
+    def __init__(self, user):
+        """
+        :param user: ZKUser, owner of the templates.
+        """
+        self.user = user
+
+    def __len__(self):
+        return 10
+
+    def __getitem__(self, fp_idx):
+        if isinstance(fp_idx, slice):
+            return [self[i] for i in range(10)[fp_idx]]
+        fptmps = self.user.fptmps or {}
+        return fptmps.get(range(10)[fp_idx], [0, 0])
+
+    def __setitem__(self, fp_idx, fptmp):
+        fp_idx = range(10)[fp_idx]
+        fp_tmp, fp_flag = fptmp
+        if fp_tmp:
+            self.user.set_user_fptmp(fp_idx, fp_tmp, fp_flag)
+        elif self.user.fptmps:
+            self.user.fptmps.pop(fp_idx, None)
+
+    def __delitem__(self, fp_idx):
+        # the finger indexes are fixed, the template is removed
+        self[fp_idx] = [0, 0]
+
+    def insert(self, fp_idx, fptmp):
+        raise TypeError("The number of finger indexes is fixed, "
+                        "use ZKUser.set_user_fptmp()")
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, FPTemplates)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
 class ZKUser:
     """
     Class to model user's properties.
+
+    A user may be created from the 72 bytes entry given by the device,
+    in that case the fields are only decoded when they are accessed.
     """
-    def __init__(self):
-        self.user_sn = None         # user's internal index
-        self.user_id = ''           # user's id
-        self.user_name = ''         # user's name
-        self.user_password = ''     # user's password
-        self.card_number = 0        # user's RF card number
-        self.admin_level = 0        # user's admin level
-        self.not_enabled = 1        # user's enable flag(active=0)
-        # user's fingerprint templates
-        # with the format [fp template, fp flag]
-        self.user_fptmps = [[0, 0]]*10
-        self.user_group = 1
-        self.user_tzs = [1, 0, 0]
+    __slots__ = ('user_sn', 'user_id', 'user_name', 'user_password',
+                 'card_number', 'admin_level', 'not_enabled',
+                 'user_group', 'user_tzs', 'fptmps', 'user_entry')
+
+    # fields decoded from the user entry
+    entry_fields = __slots__[:9]
+
+    def __init__(self, user_entry=None):
+        """
+        :param user_entry: Bytes, user entry as given on the users dataset,
+            if it is not given, the fields are set to the default values.
+        """
+        self.user_entry = user_entry    # user's entry as given by device
+        # user's fingerprint templates, dict with the finger index as key
+        # and the format [fp template, fp flag], None if there aren't any
+        self.fptmps = None
+
+        if user_entry is None:
+            self.user_sn = None         # user's internal index
+            self.user_id = ''           # user's id
+            self.user_name = ''         # user's name
+            self.user_password = ''     # user's password
+            self.card_number = 0        # user's RF card number
+            self.admin_level = 0        # user's admin level
+            self.not_enabled = 1        # user's enable flag(active=0)
+            self.user_group = 1
+            self.user_tzs = [1, 0, 0]
+
+    def __getattr__(self, name):
+        # only called for the fields that weren't decoded yet
+        if name not in ZKUser.entry_fields or self.user_entry is None:
+            raise AttributeError(name)
+
+        value = self.decode_field(name)
+        setattr(self, name, value)
+        return value
+
+    def decode_field(self, name):
+        """
+        Decodes a field from the user entry.
+
+        :param name: String, name of the field.
+        :return: Field value.
+        """
+        user_entry = self.user_entry
+
+        if name == 'user_sn':
+            return struct.unpack('<H', user_entry[0:2])[0]
+        elif name == 'admin_level':
+            return user_entry[2] >> 1
+        elif name == 'not_enabled':
+            return user_entry[2] & 1
+        elif name == 'user_password':
+            # if the password is invalid, returns ''
+            if user_entry[3] == 0x00:
+                return ''
+            return user_entry[3:11].decode('ascii').replace('\x00', '')
+        elif name == 'user_name':
+            return user_entry[11:35].decode('utf-8').replace('\x00', '')
+        elif name == 'card_number':
+            return struct.unpack('<I', user_entry[35:39])[0]
+        elif name == 'user_group':
+            return user_entry[39]
+        elif name == 'user_tzs':
+            # the user timezones are valid only if the flag is set
+            if struct.unpack('<H', user_entry[40:42])[0] == 1:
+                return list(struct.unpack('<3H', user_entry[42:48]))
+            return []
+        elif name == 'user_id':
+            return user_entry[48:57].decode('ascii').replace('\x00', '')
+
+    def is_decoded(self, name):
+        """
+        Checks if a field holds a value, i.e. it was decoded or set.
+
+        :param name: String, name of the field.
+        :return: Bool.
+        """
+        try:
+            getattr(ZKUser, name).__get__(self)
+        except AttributeError:
+            return False
+        return True
+
+    @property
+    def user_fptmps(self):
+        """
+        List with the fingerprint templates, for each finger index,
+        with the format [fp template, fp flag], [0, 0] if it doesn't exist,
+        it's a view of the fptmps dict, see FPTemplates.
+        """
+        return FPTemplates(self)
+
+    @user_fptmps.setter
+    def user_fptmps(self, user_fptmps):
+        self.fptmps = None
+        for fp_idx, (fp_tmp, fp_flag) in enumerate(user_fptmps):
+            if fp_tmp:
+                self.set_user_fptmp(fp_idx, fp_tmp, fp_flag)
 
     def set_user_info(self, user_sn, user_id, name="",
                       password="", card_no=0,
@@ -83,29 +225,57 @@ class ZKUser:
         :param fp_flag: Integer, type of fingerprint, valid(1) or duress(3).
         :return: None.
         """
-        self.user_fptmps[fp_index] = [fp_tmp, fp_flag]
+        if self.fptmps is None:
+            self.fptmps = {}
+        self.fptmps[fp_index] = [fp_tmp, fp_flag]
 
     def ser_user(self):
         """
-        Builds user entry.
+        Builds user entry, the fields that weren't decoded are copied from
+        the original user entry.
 
         :return: Bytearray, with the users info.
         """
-        user_info = bytearray([0x00] * 72)
-        user_info[0:2] = struct.pack('<H', self.user_sn)
-        user_info[2] = (self.admin_level << 1) | self.not_enabled
-        user_info[3:3+len(self.user_password)] = self.user_password.encode()
-        user_info[11:11+len(self.user_name)] = self.user_name.encode()
-        user_info[35:39] = struct.pack('<I', self.card_number)
-        user_info[39] = self.user_group
-
-        if len(self.user_tzs) != 0:
-            user_info[40:42] = bytes([1, 0])
-            user_info[42:44] = struct.pack('<H', self.user_tzs[0])
-            user_info[44:46] = struct.pack('<H', self.user_tzs[1])
-            user_info[46:48] = struct.pack('<H', self.user_tzs[2])
-
-        user_info[48:48 + len(self.user_id)] = self.user_id.encode()
+        if self.user_entry is None:
+            user_info = bytearray([0x00] * 72)
+        else:
+            user_info = bytearray(self.user_entry)
+
+        if self.is_decoded('user_sn'):
+            user_info[0:2] = struct.pack('<H', self.user_sn)
+
+        if self.is_decoded('admin_level') or self.is_decoded('not_enabled'):
+            user_info[2] = (self.admin_level << 1) | self.not_enabled
+
+        if self.is_decoded('user_password'):
+            password = self.user_password.encode()
+            user_info[3:11] = bytes(8)
+            user_info[3:3+len(password)] = password
+
+        if self.is_decoded('user_name'):
+            name = self.user_name.encode()
+            user_info[11:35] = bytes(24)
+            user_info[11:11+len(name)] = name
+
+        if self.is_decoded('card_number'):
+            user_info[35:39] = struct.pack('<I', self.card_number)
+
+        if self.is_decoded('user_group'):
+            user_info[39] = self.user_group
+
+        if self.is_decoded('user_tzs'):
+            user_info[40:48] = bytes(8)
+            if len(self.user_tzs) != 0:
+                user_info[40:42] = bytes([1, 0])
+                user_info[42:44] = struct.pack('<H', self.user_tzs[0])
+                user_info[44:46] = struct.pack('<H', self.user_tzs[1])
+                user_info[46:48] = struct.pack('<H', self.user_tzs[2])
+
+        if self.is_decoded('user_id'):
+            user_id = self.user_id.encode()
+            user_info[48:57] = bytes(9)
+            user_info[48:48 + len(user_id)] = user_id
+
         return user_info
 
 
@@ -128,6 +298,100 @@ class ATTen:
         self.ver_state = ver_state
 
 
+class AttendanceLog:
+    """
+    Attendance log, stores the entries by columns in compact arrays, the
+    times are kept encoded and the ATTen objects are only created when the
+    entries are accessed.
+    """
+    def __init__(self):
+        self.user_sns = array.array('H')    # users internal indexes
+        self.user_ids = []                  # users IDs
+        self.ver_types = array.array('B')   # verification types
+        self.att_times = array.array('I')   # encoded times of the records
+        self.ver_states = array.array('B')  # verification states
+        self.ids_cache = {}                 # shares repeated users IDs
+
+    def append(self, att_entry):
+        """
+        Appends an ATTen entry to the log.
+
+        :param att_entry: ATTen.
+        :return: None.
+        """
+        self.append_fields(att_entry.user_sn, att_entry.user_id,
+                           att_entry.ver_type,
+                           misc.encode_time_value(att_entry.att_time),
+                           att_entry.ver_state)
+
+    def append_fields(self, user_sn, user_id, ver_type, att_time, ver_state):
+        """
+        Appends an entry to the log, given its fields, no ATTen object is
+        needed.
+
+        :param user_sn: Integer, user's index on machine.
+        :param user_id: Str, user's ID.
+        :param ver_type: Integer, verification type of attendance.
+        :param att_time: Integer, encoded time of the record, see
+            misc.encode_time_value().
+        :param ver_state: Integer, verification state.
+        :return: None.
+        """
+        self.user_sns.append(user_sn)
+        self.user_ids.append(self.ids_cache.setdefault(user_id, user_id))
+        self.ver_types.append(ver_type)
+        self.att_times.append(att_time)
+        self.ver_states.append(ver_state)
+
+    def extend_raw(self, entries):
+        """
+        Appends several entries to the log.
+
+        :param entries: Iterable of tuples (user_sn, user_id, ver_type,
+            att_time, ver_state), where att_time is the encoded time.
+        :return: None.
+        """
+        for entry in entries:
+            self.append_fields(*entry)
+
+    def extend(self, att_entries):
+        """
+        Appends several ATTen entries to the log.
+
+        :param att_entries: Iterable of ATTen.
+        :return: None.
+        """
+        for att_entry in att_entries:
+            self.append(att_entry)
+
+    def __iadd__(self, att_entries):
+        self.extend(att_entries)
+        return self
+
+    def __len__(self):
+        return len(self.att_times)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            att_log = AttendanceLog()
+            att_log.user_sns = self.user_sns[idx]
+            att_log.user_ids = self.user_ids[idx]
+            att_log.ver_types = self.ver_types[idx]
+            att_log.att_times = self.att_times[idx]
+            att_log.ver_states = self.ver_states[idx]
+            att_log.ids_cache = self.ids_cache
+            return att_log
+
+        return ATTen(self.user_sns[idx], self.user_ids[idx],
+                     self.ver_types[idx],
+                     misc.decode_time_value(self.att_times[idx]),
+                     self.ver_states[idx])
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
 class OPen:
     """
     Operation log entry.
@@ -149,9 +413,96 @@ class OPen:
         self.param4 = param4
 
 
+class SNAllocator:
+    """
+    Allocates users internal indexes, the released indexes are reused,
+    starting by the lowest one.
+    """
+    def __init__(self, capacity=None):
+        """
+        :param capacity: Integer, maximum number of users, if it is None,
+            the number of users is not limited.
+        """
+        self.capacity = capacity
+        self.next_sn = 1        # lowest index that was never allocated
+        self.free_heap = []     # heap with the released indexes
+        self.free_sns = set()   # released indexes, that are still free
+
+    def reset(self, used_sns):
+        """
+        Sets the allocated indexes, the missing indexes below the highest
+        allocated index are considered free.
+
+        :param used_sns: Iterable of integers, allocated indexes.
+        :return: None.
+        """
+        used_sns = set(used_sns)
+        self.next_sn = max(used_sns) + 1 if used_sns else 1
+        self.free_heap = [sn for sn in range(1, self.next_sn)
+                          if sn not in used_sns]
+        self.free_sns = set(self.free_heap)
+
+    def count(self):
+        """
+        Returns the number of allocated indexes.
+
+        :return: Integer.
+        """
+        return self.next_sn - 1 - len(self.free_sns)
+
+    def allocate(self):
+        """
+        Allocates an index.
+
+        :return: Integer, the new index, returns -1 if the capacity
+            is reached.
+        """
+        if self.capacity is not None and self.count() >= self.capacity:
+            return -1
+
+        # released indexes are discarded lazily from the heap
+        while self.free_heap:
+            sn = heapq.heappop(self.free_heap)
+            if sn in self.free_sns:
+                self.free_sns.discard(sn)
+                return sn
+
+        sn = self.next_sn
+        self.next_sn += 1
+        return sn
+
+    def reserve(self, sn):
+        """
+        Marks a given index as allocated.
+
+        :param sn: Integer, index.
+        :return: None.
+        """
+        if sn >= self.next_sn:
+            # the skipped indexes are free
+            first_sn = self.next_sn
+            self.next_sn = sn + 1
+            for free_sn in range(first_sn, sn):
+                self.release(free_sn)
+        else:
+            self.free_sns.discard(sn)
+
+    def release(self, sn):
+        """
+        Releases an index, so it may be allocated again.
+
+        :param sn: Integer, index.
+        :return: None.
+        """
+        if sn < self.next_sn and sn not in self.free_sns:
+            self.free_sns.add(sn)
+            heapq.heappush(self.free_heap, sn)
+
+
 class ZKSS(PacketMixin, DataUserMixin,
            DataRecordMixin, TerminalMixin,
-           AccessMixin, RealtimeMixin, OtherMixin):
+           AccessMixin, RealtimeMixin, OtherMixin,
+           CacheMixin):
 
     def __init__(self):
         self.reply_number = 0           # reply counter
@@ -160,8 +511,17 @@ class ZKSS(PacketMixin, DataUserMixin,
         self.dev_platform = ''          # platform name
         self.firmware_v = ''            # firmware version
         self.users = {}                 # dict of ZKUser, the key is the id
-        self.att_log = []               # list of attendance entries
+        self.id_index = {}              # users indexes, the key is the ID
+        self.card_index = {}            # users indexes, the key is the card
+        self.sn_allocator = SNAllocator()  # allocates users indexes
+        self.att_log = AttendanceLog()  # attendance entries
+        self.att_watermark = None       # last downloaded attendance entry
         self.op_log = []                # list of operation entries
+        self.send_buffer = bytearray(1024)  # reused to build packets
+        self.recv_buffer = PacketReader()   # splits received packets
+        self.cache_enabled = False      # datasets cache flag
+        self.cache_ttl = None           # max age of cached datasets
+        self.cache_entries = {}         # counters of the cached datasets
 
     def add_user(self, user_sn):
         """
@@ -173,18 +533,98 @@ class ZKSS(PacketMixin, DataUserMixin,
         """
         if user_sn not in self.users:
             self.users[user_sn] = ZKUser()
+            self.index_user(user_sn)
+            self.sn_allocator.reserve(user_sn)
+
+    def store_user(self, user):
+        """
+        Stores a given user instance in the users of the current session,
+        if the user index isn't set, the index of the user with the same
+        ID is used, or a free index is allocated.
+
+        :param user: ZKUser, user to store.
+        :return: Integer, user's index on machine, if the user capacity of
+            the device is reached, returns -1.
+        """
+        if user.user_sn is None:
+            if self.id_exists(user.user_id):
+                user_sn = self.id_to_sn(user.user_id)
+            else:
+                user_sn = self.sn_allocator.allocate()
+                if user_sn < 0:
+                    return -1
+            user.user_sn = user_sn
+
+        if user.user_sn in self.users:
+            self.unindex_user(user.user_sn)
+            # the templates were stored in the replaced user
+            if self.users[user.user_sn] is not user:
+                self.invalidate_cache('fptmps')
+        self.users[user.user_sn] = user
+        self.index_user(user.user_sn)
+        self.sn_allocator.reserve(user.user_sn)
+        return user.user_sn
+
+    def index_user(self, user_sn):
+        """
+        Adds a user to the indexes by user ID and card number, it should
+        be called after the user's info changes.
+
+        :param user_sn: Integer, user's index on machine.
+        :return: None.
+        """
+        zuser = self.users[user_sn]
+        if zuser.user_id:
+            self.id_index[zuser.user_id] = user_sn
+        if zuser.card_number:
+            self.card_index[zuser.card_number] = user_sn
+
+    def unindex_user(self, user_sn):
+        """
+        Removes a user from the indexes by user ID and card number, it
+        should be called before the user's info changes.
+
+        :param user_sn: Integer, user's index on machine.
+        :return: None.
+        """
+        zuser = self.users[user_sn]
+        if self.id_index.get(zuser.user_id) == user_sn:
+            del self.id_index[zuser.user_id]
+        if self.card_index.get(zuser.card_number) == user_sn:
+            del self.card_index[zuser.card_number]
+
+    def rebuild_user_index(self):
+        """
+        Builds again the indexes by user ID and card number, from the
+        users dict.
+
+        :return: None.
+        """
+        self.id_index = {}
+        self.card_index = {}
+        for user_sn in self.users:
+            self.index_user(user_sn)
 
     def id_exists(self, user_id):
-        for sn in self.users:
-            if self.users[sn].user_id == user_id:
-                return True
-        return False
+        """
+        Checks if a user ID exists in the users dict.
+
+        :param user_id: Str, user's ID.
+        :return: Bool, True if the user exists.
+        """
+        return user_id in self.id_index
 
     def create_user(self):
-        try:
-            new_user_sn = max(list(self.users.keys()))+1
-        except ValueError:
-            new_user_sn = 1
+        """
+        Appends an empty user instance, with a free user index, freed
+        indexes of deleted users are reused.
+
+        :return: Integer, user's index on machine, if the user capacity of
+            the device is reached, returns -1.
+        """
+        new_user_sn = self.sn_allocator.allocate()
+        if new_user_sn < 0:
+            return -1
         self.add_user(new_user_sn)
         return new_user_sn
 
@@ -238,14 +678,10 @@ class ZKSS(PacketMixin, DataUserMixin,
 
             zuser = self.users[sn]
 
-            for fp_idx in range(len(zuser.user_fptmps)):
-                # if fp template doesn't exists, skip
-                if not zuser.user_fptmps[fp_idx][0]:
-                    continue
-
+            # only the existing templates are stored
+            for fp_idx in sorted(zuser.fptmps or {}):
                 # add template, index and flag to table row
-                fptmp = zuser.user_fptmps[fp_idx][0]
-                flg = zuser.user_fptmps[fp_idx][1]
+                fptmp, flg = zuser.fptmps[fp_idx]
                 fptmp_table.add_row([
                     zuser.user_id,
                     zuser.user_name,
@@ -312,10 +748,17 @@ class ZKSS(PacketMixin, DataUserMixin,
         :return: Integer, user's index on machine,
             if the user doesn't exists, returns -1.
         """
-        for sn in self.users:
-            if self.users[sn].user_id == user_id:
-                return sn
-        return -1
+        return self.id_index.get(user_id, -1)
+
+    def card_to_sn(self, card_no):
+        """
+        Obtains the user internal index, given the user's card number.
+
+        :param card_no: Integer, user's RF card number.
+        :return: Integer, user's index on machine,
+            if the card isn't assigned, returns -1.
+        """
+        return self.card_index.get(card_no, -1)
 
     def append_att_entry(self, user_sn, user_id, ver_type,
                          att_time, ver_state):
@@ -329,8 +772,9 @@ class ZKSS(PacketMixin, DataUserMixin,
         :param ver_state: Integer, verification state.
         :return: None.
         """
-        self.att_log += [ATTen(user_sn, user_id, ver_type,
-                               att_time, ver_state)]
+        self.att_log.append_fields(user_sn, user_id, ver_type,
+                                   misc.encode_time_value(att_time),
+                                   ver_state)
 
     def append_op_entry(self, op_id, op_time, param1,
                         param2, param3, param4):
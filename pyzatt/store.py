@@ -0,0 +1,259 @@
+import sqlite3
+import pyzatt.misc as misc
+from pyzatt.pyzatt import ZKUser, AttendanceLog, OPen
+from pyzatt.zkmodules.cache import CACHE_COUNTERS
+from pyzatt.zkmodules.data_record import att_log_watermark
+
+"""
+This file contains a local store of the data of the devices, the users,
+templates and logs are kept on a SQLite database between sessions, so
+only the datasets that changed on the device are downloaded again.
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    serial TEXT, user_sn INTEGER, user_entry BLOB,
+    PRIMARY KEY (serial, user_sn));
+CREATE TABLE IF NOT EXISTS fptmps (
+    serial TEXT, user_sn INTEGER, fp_index INTEGER, fp_flag INTEGER,
+    fp_tmp BLOB,
+    PRIMARY KEY (serial, user_sn, fp_index));
+CREATE TABLE IF NOT EXISTS att_log (
+    serial TEXT, seq INTEGER, user_sn INTEGER, user_id TEXT,
+    ver_type INTEGER, att_time INTEGER, ver_state INTEGER,
+    PRIMARY KEY (serial, seq));
+CREATE TABLE IF NOT EXISTS op_log (
+    serial TEXT, seq INTEGER, op_id INTEGER, op_time INTEGER,
+    param1 INTEGER, param2 INTEGER, param3 INTEGER, param4 INTEGER,
+    PRIMARY KEY (serial, seq));
+CREATE TABLE IF NOT EXISTS counters (
+    serial TEXT, dataset TEXT, counters TEXT,
+    PRIMARY KEY (serial, dataset));
+"""
+
+
+class ZKStore:
+    """
+    Local store of the data of several devices, identified by their
+    serial numbers.
+    """
+    def __init__(self, path):
+        """
+        :param path: String, path of the database file, ":memory:" may be
+            used for a temporary store.
+        """
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        """
+        Closes the database.
+
+        :return: None.
+        """
+        self.conn.close()
+
+    def get_counters(self, serial, dataset):
+        """
+        Returns the status counters of the device when the dataset was
+        stored.
+
+        :param serial: String, serial number of the device.
+        :param dataset: String, name of the dataset, see CACHE_COUNTERS.
+        :return: Tuple of integers, or None if the dataset isn't stored.
+        """
+        row = self.conn.execute(
+            "SELECT counters FROM counters WHERE serial=? AND dataset=?",
+            (serial, dataset)).fetchone()
+        if row is None:
+            return None
+        return tuple(int(c) for c in row[0].split(','))
+
+    def set_counters(self, serial, dataset, counters):
+        """
+        Stores the status counters of a dataset.
+
+        :param serial: String, serial number of the device.
+        :param dataset: String, name of the dataset, see CACHE_COUNTERS.
+        :param counters: Tuple of integers.
+        :return: None.
+        """
+        self.conn.execute(
+            "INSERT OR REPLACE INTO counters VALUES (?, ?, ?)",
+            (serial, dataset, ','.join(str(c) for c in counters)))
+
+    def save_users(self, serial, users):
+        """
+        Replaces the stored users of a device, without the templates.
+
+        :param serial: String, serial number of the device.
+        :param users: Dictionary of ZKUser, the key is the user index.
+        :return: None.
+        """
+        self.conn.execute("DELETE FROM users WHERE serial=?", (serial,))
+        self.conn.executemany(
+            "INSERT INTO users VALUES (?, ?, ?)",
+            ((serial, user_sn, bytes(user.ser_user()))
+             for user_sn, user in users.items()))
+
+    def load_users(self, serial):
+        """
+        Loads the stored users of a device, without the templates.
+
+        :param serial: String, serial number of the device.
+        :return: Dictionary of ZKUser, the key is the user index.
+        """
+        users = {}
+        for user_sn, user_entry in self.conn.execute(
+                "SELECT user_sn, user_entry FROM users WHERE serial=?",
+                (serial,)):
+            users[user_sn] = ZKUser(user_entry)
+        return users
+
+    def save_fptmps(self, serial, users):
+        """
+        Replaces the stored templates of a device.
+
+        :param serial: String, serial number of the device.
+        :param users: Dictionary of ZKUser, the key is the user index.
+        :return: None.
+        """
+        self.conn.execute("DELETE FROM fptmps WHERE serial=?", (serial,))
+        self.conn.executemany(
+            "INSERT INTO fptmps VALUES (?, ?, ?, ?, ?)",
+            ((serial, user_sn, fp_index, fp_flag, bytes(fp_tmp))
+             for user_sn, user in users.items()
+             for fp_index, (fp_tmp, fp_flag) in
+             (user.fptmps or {}).items()))
+
+    def load_fptmps(self, serial, users):
+        """
+        Loads the stored templates of a device in the given users.
+
+        :param serial: String, serial number of the device.
+        :param users: Dictionary of ZKUser, the key is the user index,
+            the templates of missing users are ignored.
+        :return: None.
+        """
+        for user_sn, fp_index, fp_flag, fp_tmp in self.conn.execute(
+                "SELECT user_sn, fp_index, fp_flag, fp_tmp FROM fptmps "
+                "WHERE serial=?", (serial,)):
+            if user_sn in users:
+                users[user_sn].set_user_fptmp(fp_index, bytearray(fp_tmp),
+                                              fp_flag)
+
+    def append_att_log(self, serial, att_log):
+        """
+        Appends attendance entries to the stored log of a device.
+
+        :param serial: String, serial number of the device.
+        :param att_log: AttendanceLog, entries to append.
+        :return: None.
+        """
+        seq = self.conn.execute(
+            "SELECT COALESCE(MAX(seq) + 1, 0) FROM att_log WHERE serial=?",
+            (serial,)).fetchone()[0]
+        self.conn.executemany(
+            "INSERT INTO att_log VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((serial, seq + i) + entry for i, entry in enumerate(zip(
+                att_log.user_sns, att_log.user_ids, att_log.ver_types,
+                att_log.att_times, att_log.ver_states))))
+
+    def load_att_log(self, serial):
+        """
+        Loads the stored attendance log of a device.
+
+        :param serial: String, serial number of the device.
+        :return: AttendanceLog.
+        """
+        att_log = AttendanceLog()
+        att_log.extend_raw(self.conn.execute(
+            "SELECT user_sn, user_id, ver_type, att_time, ver_state "
+            "FROM att_log WHERE serial=? ORDER BY seq", (serial,)))
+        return att_log
+
+    def save_op_log(self, serial, op_log):
+        """
+        Replaces the stored operation log of a device.
+
+        :param serial: String, serial number of the device.
+        :param op_log: List of OPen.
+        :return: None.
+        """
+        self.conn.execute("DELETE FROM op_log WHERE serial=?", (serial,))
+        self.conn.executemany(
+            "INSERT INTO op_log VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((serial, seq, op.op_id, misc.encode_time_value(op.op_time),
+              op.param1, op.param2, op.param3, op.param4)
+             for seq, op in enumerate(op_log)))
+
+    def load_op_log(self, serial):
+        """
+        Loads the stored operation log of a device.
+
+        :param serial: String, serial number of the device.
+        :return: List of OPen.
+        """
+        return [OPen(op_id, misc.decode_time_value(op_time), *params)
+                for op_id, op_time, *params in self.conn.execute(
+                    "SELECT op_id, op_time, param1, param2, param3, param4 "
+                    "FROM op_log WHERE serial=? ORDER BY seq", (serial,))]
+
+    def sync(self, zk):
+        """
+        Loads the stored data of the device in the given session, and
+        downloads only the datasets that changed since the last sync, the
+        new data is stored. The attendance log is kept as an archive, the
+        entries are appended even if the log is cleared on the device.
+
+        :param zk: ZKSS, connected session.
+        :return: Dictionary, with the names of the datasets as keys and
+            True as value if the dataset was downloaded.
+        """
+        serial = zk.get_serial_number().strip('\x00')
+        stat_keys = zk.get_device_status(
+            {k: -1 for keys in CACHE_COUNTERS.values() for k in keys})
+        counters = {dataset: tuple(stat_keys[k] for k in keys)
+                    for dataset, keys in CACHE_COUNTERS.items()}
+
+        def changed(dataset):
+            return -1 in counters[dataset] or \
+                self.get_counters(serial, dataset) != counters[dataset]
+
+        synced = {dataset: changed(dataset) for dataset in CACHE_COUNTERS}
+
+        with self.conn:
+            if synced['users']:
+                zk.read_all_user_id()
+                self.save_users(serial, zk.users)
+            else:
+                zk.users = self.load_users(serial)
+                zk.rebuild_user_index()
+                zk.sn_allocator.reset(zk.users)
+
+            if synced['fptmps']:
+                zk.read_all_fptmp()
+                self.save_fptmps(serial, zk.users)
+            else:
+                self.load_fptmps(serial, zk.users)
+
+            # the attendance watermark is the last entry of the device log
+            # when it was stored
+            zk.att_watermark = self.get_counters(serial, 'att_watermark')
+            if synced['att_log']:
+                new_entries = zk.read_new_att_log()
+                self.append_att_log(serial, new_entries)
+                self.set_counters(serial, 'att_watermark',
+                                  att_log_watermark(zk.att_log))
+            zk.att_log = self.load_att_log(serial)
+
+            if synced['op_log']:
+                zk.read_op_log()
+                self.save_op_log(serial, zk.op_log)
+            else:
+                zk.op_log = self.load_op_log(serial)
+
+            for dataset in CACHE_COUNTERS:
+                self.set_counters(serial, dataset, counters[dataset])
+
+        return synced
@@ -35,6 +35,7 @@ class AccessMixin:
         grp_chg = bytearray(struct.pack('<I', user_sn)+bytes([group_no]))
         self.send_command(cmd=DEFS.CMD_USERGRP_WRQ, data=grp_chg)
         self.recv_reply()
+        self.invalidate_cache('users')
         self.refresh_data()
 
     def get_tz_info(self, tz_no):
@@ -222,6 +223,7 @@ class AccessMixin:
 
         self.send_command(cmd=DEFS.CMD_USERTZ_WRQ, data=new_tz)
         self.recv_reply()
+        self.invalidate_cache('users')
         self.refresh_data()
 
     def disable_user_tzs(self, user_id):
@@ -0,0 +1,99 @@
+import time
+
+"""
+This file contains the functions to avoid downloading again the datasets
+that didn't change on the device, the status counters of the device are
+compared with the counters taken when the dataset was downloaded.
+"""
+
+# status counters that change along with each dataset
+CACHE_COUNTERS = {
+    'users': ('user_count',),
+    'fptmps': ('user_count', 'fp_count'),
+    'att_log': ('attlog_count',),
+    'op_log': ('oplog_count',)
+}
+
+
+class CacheMixin:
+
+    def enable_cache(self, ttl=None):
+        """
+        Enables the datasets cache, when the status counters of a dataset
+        didn't change since the last download, the read functions keep the
+        session data instead of downloading the dataset again.
+
+        :param ttl: Float, maximum age of the cached datasets in seconds, if
+            it is None, the datasets are kept while the counters don't
+            change.
+        :return: None.
+        """
+        self.cache_enabled = True
+        self.cache_ttl = ttl
+
+    def disable_cache(self):
+        """
+        Disables the datasets cache, every read function downloads the
+        dataset.
+
+        :return: None.
+        """
+        self.cache_enabled = False
+        self.invalidate_cache()
+
+    def lookup_cache(self, dataset):
+        """
+        Checks if a dataset is cached, the status counters are requested to
+        the device.
+
+        :param dataset: String, name of the dataset, see CACHE_COUNTERS.
+        :return: Tuple (hit, counters), hit is True if the dataset didn't
+            change, counters are the current status counters of the dataset,
+            to be given to update_cache() after a download, they are None if
+            the cache is disabled.
+        """
+        if not self.cache_enabled:
+            return False, None
+
+        stat_keys = self.get_device_status(
+            {k: -1 for k in CACHE_COUNTERS[dataset]})
+        counters = tuple(stat_keys[k] for k in CACHE_COUNTERS[dataset])
+
+        if dataset not in self.cache_entries:
+            return False, counters
+
+        cached_counters, cached_time = self.cache_entries[dataset]
+        if self.cache_ttl is not None and \
+                time.monotonic() - cached_time > self.cache_ttl:
+            return False, counters
+
+        return counters == cached_counters, counters
+
+    def update_cache(self, dataset, counters):
+        """
+        Marks a dataset as cached, after it was downloaded.
+
+        :param dataset: String, name of the dataset, see CACHE_COUNTERS.
+        :param counters: Tuple, status counters given by lookup_cache(), if
+            it is None or a counter couldn't be read, the dataset isn't
+            cached.
+        :return: None.
+        """
+        if counters is None or -1 in counters:
+            self.cache_entries.pop(dataset, None)
+            return
+        self.cache_entries[dataset] = (counters, time.monotonic())
+
+    def invalidate_cache(self, *datasets):
+        """
+        Removes datasets from the cache, so they are downloaded on the next
+        read, it must be used after writing data to the device.
+
+        :param datasets: Strings, names of the datasets, if none is given,
+            every dataset is removed.
+        :return: None.
+        """
+        if not datasets:
+            self.cache_entries.clear()
+        for dataset in datasets:
+            self.cache_entries.pop(dataset, None)
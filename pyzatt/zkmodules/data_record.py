@@ -1,7 +1,13 @@
+import array
 import struct
 import pyzatt.zkmodules.defs as DEFS
 import pyzatt.misc as misc
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 """
 This file contains the functions related to manage records
 in attendance devices.
@@ -9,6 +15,94 @@ in attendance devices.
 Author: Alexander Marin <alexuzmarin@gmail.com>
 """
 
+# attendance log entry, 40 bytes long: user internal index, user id,
+# verification type, encoded time and verification state
+ATT_ENTRY = struct.Struct('<H9s15xBIB8x')
+
+if np is not None:
+    # same layout of the attendance log entry, as a numpy dtype
+    ATT_DTYPE = np.dtype([('user_sn', '<u2'), ('user_id', 'S9'),
+                          ('', 'V15'), ('ver_type', 'u1'),
+                          ('att_time', '<u4'), ('ver_state', 'u1'),
+                          ('', 'V8')])
+
+
+def decode_att_entries(block):
+    """
+    Decodes a block of attendance log entries.
+
+    :param block: Bytes-like object, with whole 40 bytes entries.
+    :return: Generator of tuples (user_sn, user_id, ver_type, att_time,
+        ver_state), where att_time is the encoded time, see
+        misc.decode_time_value().
+    """
+    for user_sn, user_id, ver_type, att_time, ver_state in \
+            ATT_ENTRY.iter_unpack(block):
+        yield (user_sn, user_id.replace(b'\x00', b'').decode('ascii'),
+               ver_type, att_time, ver_state)
+
+
+def decode_op_entry(op_entry):
+    """
+    Decodes an operation log entry, 16 bytes long.
+
+    :param op_entry: Bytes-like object, whole entry.
+    :return: OPen.
+    """
+    from pyzatt.pyzatt import OPen
+
+    # extracts the operation fields
+    op_id = op_entry[2]
+    op_time = misc.decode_time(op_entry[4:8])
+
+    # extract params
+    param1, param2, param3, param4 = struct.unpack('<4H', op_entry[8:16])
+
+    return OPen(op_id, op_time, param1, param2, param3, param4)
+
+
+def att_log_watermark(att_log):
+    """
+    Gives the watermark of an attendance log, it identifies the last entry
+    of the log, to find the entries added after it on a later download.
+
+    :param att_log: AttendanceLog.
+    :return: Tuple (att_count, att_time, user_sn), with the number of
+        entries, the encoded time and the user index of the last entry,
+        the time and index are -1 if the log is empty.
+    """
+    if not len(att_log):
+        return 0, -1, -1
+    return len(att_log), att_log.att_times[-1], att_log.user_sns[-1]
+
+
+def find_new_att_entries(att_log, watermark):
+    """
+    Finds the position of the first entry newer than a watermark, if the
+    log of the device was cleared or the entry of the watermark isn't found,
+    every entry is considered new.
+
+    :param att_log: AttendanceLog, downloaded log.
+    :param watermark: Tuple, see att_log_watermark(), or None.
+    :return: Integer, position of the first new entry.
+    """
+    if watermark is None:
+        return 0
+    att_count, att_time, user_sn = watermark
+
+    # usual case, the entries were appended after the watermark
+    if 0 < att_count <= len(att_log) and \
+            att_log.att_times[att_count - 1] == att_time and \
+            att_log.user_sns[att_count - 1] == user_sn:
+        return att_count
+
+    # the oldest entries were dropped, look for the last entry
+    for i in range(min(att_count, len(att_log)) - 1, -1, -1):
+        if att_log.att_times[i] == att_time and \
+                att_log.user_sns[i] == user_sn:
+            return i + 1
+    return 0
+
 
 class DataRecordMixin:
 
@@ -17,41 +111,117 @@ class DataRecordMixin:
         Requests the attendance log.
 
         :return: None. Stores the attendance log entries
-            in the att_log attribute.
+            in the att_log attribute, if the cache is enabled and the log
+            didn't change, the attribute is kept.
+        """
+        from pyzatt.pyzatt import AttendanceLog
+
+        hit, counters = self.lookup_cache('att_log')
+        if hit:
+            return
+
+        self.send_command(cmd=DEFS.CMD_DATA_WRRQ,
+                          data=bytearray.fromhex('010d000000000000000000'))
+
+        # the entries are stored without creating an object for each one
+        self.att_log = AttendanceLog()
+        for block in misc.iter_record_blocks(self.iter_long_reply(),
+                                             ATT_ENTRY.size):
+            self.att_log.extend_raw(decode_att_entries(block))
+        self.att_watermark = att_log_watermark(self.att_log)
+        self.update_cache('att_log', counters)
+
+    def read_new_att_log(self):
+        """
+        Requests the attendance entries added since the last download, the
+        number of entries on the device is checked first, so the log isn't
+        transferred when there are no new entries. The position of the last
+        download is kept in the att_watermark attribute, it may be set to a
+        saved value to resume from a previous session.
+
+        :return: AttendanceLog, with the new entries. The att_log attribute
+            is updated with the whole log, if it was downloaded.
         """
+        from pyzatt.pyzatt import AttendanceLog
+
+        watermark = self.att_watermark
+        if watermark is not None:
+            att_count = self.get_device_status(
+                {'attlog_count': -1})['attlog_count']
+            if att_count == watermark[0]:
+                return AttendanceLog()
+
+        self.read_att_log()
+        return self.att_log[find_new_att_entries(self.att_log, watermark):]
+
+    def iter_att_log(self):
+        """
+        Requests the attendance log, the entries are decoded as the dataset
+        is received, the att_log attribute is not modified.
+
+        :return: Generator of ATTen.
+        """
+        from pyzatt.pyzatt import ATTen
+
         self.send_command(cmd=DEFS.CMD_DATA_WRRQ,
                           data=bytearray.fromhex('010d000000000000000000'))
-        self.recv_long_reply()
 
-        # clear the attendance log attribute
-        self.att_log = []
+        # decode blocks of whole entries, as they are received
+        for block in misc.iter_record_blocks(self.iter_long_reply(),
+                                             ATT_ENTRY.size):
+            for user_sn, user_id, ver_type, att_time, ver_state in \
+                    decode_att_entries(block):
+                yield ATTen(user_sn, user_id, ver_type,
+                            misc.decode_time_value(att_time), ver_state)
 
-        # get number of log entries
-        att_count = struct.unpack('<H', self.last_payload_data[0:2])[0]/40
-        att_count = int(att_count)
+    def read_att_log_columns(self, use_numpy=True):
+        """
+        Requests the attendance log and decodes it by columns, no objects
+        are created for each entry, the att_log attribute is not modified.
+
+        :param use_numpy: Bool, if numpy is available, the columns are given
+            as numpy arrays, otherwise they are given as arrays from the
+            array module, except the user id column, given as a list.
+        :return: Dictionary, with the columns user_sn, user_id, ver_type,
+            att_time and ver_state, where att_time has the encoded times,
+            see misc.decode_time_value().
+        """
+        self.send_command(cmd=DEFS.CMD_DATA_WRRQ,
+                          data=bytearray.fromhex('010d000000000000000000'))
+        att_dataset = self.recv_long_reply()
 
         # skip the size of log and zeros
-        i = 4
-
-        # extract the fields from each log entry
-        for idx in range(att_count):
-            # user internal index
-            user_sn = struct.unpack('<H', self.last_payload_data[i:i+2])[0]
-            # user id
-            user_id = self.last_payload_data[i+2:i+11].decode('ascii').\
-                replace('\x00', '')
-            # verification type
-            ver_type = self.last_payload_data[i+26]
-            # time of the record
-            att_time = misc.decode_time(self.last_payload_data[i+27:i+31])
-            # verification state
-            ver_state = self.last_payload_data[i+31]
-
-            # append attendance entry
-            self.append_att_entry(user_sn, user_id, ver_type,
-                                  att_time, ver_state)
-
-            i += 40
+        att_count = (len(att_dataset) - 4) // ATT_ENTRY.size
+        if att_count < 0:
+            att_count = 0
+
+        if use_numpy and np is not None:
+            entries = np.frombuffer(att_dataset, dtype=ATT_DTYPE,
+                                    count=att_count, offset=4)
+            return {
+                'user_sn': entries['user_sn'],
+                'user_id': entries['user_id'],
+                'ver_type': entries['ver_type'],
+                'att_time': entries['att_time'],
+                'ver_state': entries['ver_state']
+            }
+
+        columns = {
+            'user_sn': array.array('H'),
+            'user_id': [],
+            'ver_type': array.array('B'),
+            'att_time': array.array('I'),
+            'ver_state': array.array('B')
+        }
+        block = memoryview(att_dataset)[4:4 + att_count * ATT_ENTRY.size]
+        for user_sn, user_id, ver_type, att_time, ver_state in \
+                decode_att_entries(block):
+            columns['user_sn'].append(user_sn)
+            columns['user_id'].append(user_id)
+            columns['ver_type'].append(ver_type)
+            columns['att_time'].append(att_time)
+            columns['ver_state'].append(ver_state)
+        return columns
 
     def clear_att_log(self):
         """
@@ -61,43 +231,41 @@ class DataRecordMixin:
         """
         self.send_command(cmd=DEFS.CMD_CLEAR_ATTLOG)
         self.recv_reply()
+        self.invalidate_cache('att_log')
         self.refresh_data()
 
     def read_op_log(self):
         """
         Requests the operation log.
 
-        :return: None. Stores the operation log in the op_log attribute.
+        :return: None. Stores the operation log in the op_log attribute, if
+            the cache is enabled and the log didn't change, the attribute is
+            kept.
         """
-        self.send_command(cmd=DEFS.CMD_DATA_WRRQ,
-                          data=bytearray.fromhex('0122000000000000000000'))
-        self.recv_long_reply()
+        hit, counters = self.lookup_cache('op_log')
+        if hit:
+            return
 
         # clears the operation log attribute
         self.op_log = []
 
-        # extracts number of op log entries
-        op_count = struct.unpack('<H', self.last_payload_data[0:2])[0] / 16
-        op_count = int(op_count)
-
-        # skips the log size and zeros
-        i = 4
-        # extracts the operation fields from each entry
-        for idx in range(op_count):
-            op_id = self.last_payload_data[i+2]
-            op_time = misc.decode_time(self.last_payload_data[i + 4:i + 8])
+        for op_entry in self.iter_op_log():
+            self.op_log += [op_entry]
+        self.update_cache('op_log', counters)
 
-            # extract params
-            param1 = struct.unpack('<H', self.last_payload_data[i+8:i+10])[0]
-            param2 = struct.unpack('<H', self.last_payload_data[i+10:i+12])[0]
-            param3 = struct.unpack('<H', self.last_payload_data[i+12:i+14])[0]
-            param4 = struct.unpack('<H', self.last_payload_data[i+14:i+16])[0]
+    def iter_op_log(self):
+        """
+        Requests the operation log, the entries are decoded as the dataset
+        is received, the op_log attribute is not modified.
 
-            # append operation log entry
-            self.append_op_entry(op_id, op_time, param1,
-                                 param2, param3, param4)
+        :return: Generator of OPen.
+        """
+        self.send_command(cmd=DEFS.CMD_DATA_WRRQ,
+                          data=bytearray.fromhex('0122000000000000000000'))
 
-            i += 16
+        # every entry is 16 bytes long
+        for op_entry in misc.iter_records(self.iter_long_reply(), 16):
+            yield decode_op_entry(op_entry)
 
     def clear_op_log(self):
         """
@@ -107,6 +275,7 @@ class DataRecordMixin:
         """
         self.send_command(cmd=DEFS.CMD_CLEAR_OPLOG)
         self.recv_reply()
+        self.invalidate_cache('op_log')
         self.refresh_data()
 
     def clear_data(self, data_type=None):
@@ -129,4 +298,5 @@ class DataRecordMixin:
         else:
             self.send_command(cmd=DEFS.CMD_CLEAR_DATA)
         self.recv_reply()
+        self.invalidate_cache()
         self.refresh_data()
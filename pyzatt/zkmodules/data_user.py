@@ -1,5 +1,7 @@
+import collections
 import struct
 import pyzatt.zkmodules.defs as DEFS
+import pyzatt.misc as misc
 
 """
 This file contains the functions to manage the user's data, fingerprints,
@@ -9,85 +11,82 @@ Author: Alexander Marin <alexuzmarin@gmail.com>
 """
 
 
+def decode_fp_entry(fp_entry):
+    """
+    Decodes a fingerprint template entry, as given on the templates
+    dataset, every entry is 6 bytes + template length.
+
+    :param fp_entry: Bytes-like object, whole template entry.
+    :return: Tuple (user_sn, fp_index, fp_tmp, fp_flag), where fp_tmp is a
+        bytearray with the template.
+    """
+    # extract user serial number
+    user_sn = struct.unpack('<H', fp_entry[2:4])[0]
+
+    # get fingerprint index
+    fp_idx = fp_entry[4]
+
+    # get fingerprint flag
+    fp_flg = fp_entry[5]
+
+    # extract template
+    fp_tmp = bytearray(fp_entry[6:])
+
+    return user_sn, fp_idx, fp_tmp, fp_flg
+
+
 class DataUserMixin:
 
     def read_all_user_id(self):
         """
         Requests all the users info, except the fingerprint templates.
 
-        :return: None. Stores the users info in the ZKUsers dict.
+        :return: None. Stores the users info in the ZKUsers dict, if the
+            cache is enabled and the users didn't change, the dict is kept.
         """
-        self.send_command(cmd=DEFS.CMD_DATA_WRRQ,
-                          data=bytearray.fromhex('0109000500000000000000'))
-
-        # receive dataset with users info
-        users_dataset = self.recv_long_reply()
-        total_size_dataset = len(users_dataset)
+        hit, counters = self.lookup_cache('users')
+        if hit:
+            return
 
         # clear the users dict
         self.users = {}
+        self.rebuild_user_index()
 
-        # skip first 4 bytes (size + zeros)
-        i = 4
-        while i < total_size_dataset:
-            # extract serial number
-            user_sn = struct.unpack('<H', users_dataset[i:i+2])[0]
-
-            # extract permission token
-            perm_token = users_dataset[i+2]
+        for user in self.iter_users():
+            self.users[user.user_sn] = user
+            self.index_user(user.user_sn)
 
-            # extract user password, if it is invalid, stores ''
-            if users_dataset[i+3] != 0x00:
-                password = users_dataset[i + 3:i + 11]
-                # remove trailing zeros
-                password = password.decode('ascii').replace('\x00', '')
+        self.sn_allocator.reset(self.users)
+        self.update_cache('users', counters)
+        # the templates were stored in the removed users
+        self.invalidate_cache('fptmps')
 
-            else:
-                password = ''
+    def iter_users(self):
+        """
+        Requests all the users info, except the fingerprint templates, the
+        users are decoded as the dataset is received, the ZKUsers dict
+        is not modified.
 
-            # extract user name
-            user_name = users_dataset[i+11:i+35].decode('utf-8')
+        :return: Generator of ZKUser.
+        """
+        self.send_command(cmd=DEFS.CMD_DATA_WRRQ,
+                          data=bytearray.fromhex('0109000500000000000000'))
 
-            # remove non printable chars
-            user_name = user_name.replace('\x00', '')
+        # every user entry is 72 bytes long
+        for user_entry in misc.iter_records(self.iter_long_reply(), 72):
+            yield self.decode_user_entry(user_entry)
 
-            # extract card number
-            card_no = struct.unpack('<I', users_dataset[i+35:i+39])[0]
+    def decode_user_entry(self, user_entry):
+        """
+        Creates a user from a user entry, as given on the users dataset,
+        the fields of the user are decoded when they are accessed.
 
-            # extract group number
-            group_no = users_dataset[i+39]
+        :param user_entry: Bytes-like object, 72 bytes user entry.
+        :return: ZKUser, with the users info.
+        """
+        from pyzatt.pyzatt import ZKUser
 
-            # extract user timezones if they exists
-            if struct.unpack('<H', users_dataset[i+40:i+42])[0] == 1:
-                user_tzs = [0]*3
-                user_tzs[0] = struct.unpack('<H', users_dataset[i+42:i+44])[0]
-                user_tzs[1] = struct.unpack('<H', users_dataset[i+44:i+46])[0]
-                user_tzs[2] = struct.unpack('<H', users_dataset[i+46:i+48])[0]
-            else:
-                user_tzs = []
-
-            # extract the user id
-            user_id = users_dataset[i+48:i+57].decode('ascii')
-
-            # remove non printable chars
-            user_id = user_id.replace('\x00', '')
-
-            # append user to the list of users
-            self.add_user(user_sn)
-            # set the corresponding info
-            self.users[user_sn].set_user_info(
-                                            user_id=user_id,
-                                            user_sn=user_sn,
-                                            name=user_name,
-                                            password=password,
-                                            card_no=card_no,
-                                            admin_lv=perm_token >> 1,
-                                            neg_enabled=perm_token & 1,
-                                            user_group=group_no,
-                                            user_tzs=user_tzs
-                                            )
-            # every user entry is 72 bytes long
-            i += 72
+        return ZKUser(bytes(user_entry))
 
     def get_verify_style(self, user_id):
         """
@@ -116,6 +115,7 @@ class DataUserMixin:
         ver_data[2] = verify_style
         self.send_command(cmd=DEFS.CMD_VERIFY_WRQ, data=ver_data)
         self.recv_reply()
+        self.invalidate_cache('users')
         return self.recvd_ack()
 
     def delete_user(self, user_id):
@@ -125,10 +125,18 @@ class DataUserMixin:
         :param user_id: String, user's ID.
         :return: None.
         """
-        user_sn = self.users[self.id_to_sn(user_id)].user_sn
+        user_sn = self.id_to_sn(user_id)
         del_data = bytearray(struct.pack('<H', user_sn))
         self.send_command(DEFS.CMD_DELETE_USER, del_data)
         self.recv_reply()
+
+        # remove the user from the session
+        if self.recvd_ack() and user_sn in self.users:
+            self.unindex_user(user_sn)
+            del self.users[user_sn]
+            self.sn_allocator.release(user_sn)
+
+        self.invalidate_cache('users', 'fptmps')
         self.refresh_data()
 
     def set_user_info(self, user_id, name="",
@@ -158,8 +166,12 @@ class DataUserMixin:
         else:
             # user doesn't exists
             user_sn = self.create_user()
+            if user_sn < 0:
+                print("User capacity reached")
+                return
 
         # set the corresponding info
+        self.unindex_user(user_sn)
         self.users[user_sn].set_user_info(
             user_id=user_id,
             user_sn=user_sn,
@@ -171,6 +183,7 @@ class DataUserMixin:
             user_group=user_group,
             user_tzs=user_tzs
         )
+        self.index_user(user_sn)
         self.upload_user_info(user_id)
 
     def upload_user_info(self, user_id, user_info=None):
@@ -186,7 +199,115 @@ class DataUserMixin:
 
         self.send_command(cmd=DEFS.CMD_USER_WRQ, data=user_info)
         self.recv_reply()
+        self.invalidate_cache('users')
+        self.refresh_data()
+
+    def upload_users(self, users, window=16):
+        """
+        Uploads several users, the write commands are sent without waiting
+        for each reply, keeping up to a given number of pending replies,
+        and the data is refreshed only once, at the end.
+
+        :param users: Iterable of ZKUser, users to upload, they are stored
+            in the ZKUsers dict, if the user index isn't set, the index of
+            the user with the same ID is used, or a free one is allocated.
+        :param window: Integer, maximum number of commands waiting for
+            a reply.
+        :return: List of bools, with the result of each user, in the
+            given order, True if the device acknowledged the user.
+        """
+        results = []
+        # reply counters of the commands waiting for a reply, with the
+        # position of the user in the results
+        pending = collections.OrderedDict()
+
+        for user in users:
+            results.append(False)
+            if self.store_user(user) < 0:
+                print("User capacity reached")
+                continue
+
+            pending[self.reply_number] = len(results) - 1
+            self.send_command(cmd=DEFS.CMD_USER_WRQ, data=user.ser_user())
+            self.reply_number += 1
+
+            if len(pending) >= window:
+                self.recv_pending_reply(pending, results)
+
+        # receive the remaining replies
+        while pending:
+            self.recv_pending_reply(pending, results)
+
+        self.invalidate_cache('users', 'fptmps')
+        self.refresh_data()
+        return results
+
+    def recv_pending_reply(self, pending, results):
+        """
+        Receives the reply of a pipelined command and stores its result,
+        the reply is matched with the command by the reply counter, the
+        commands sent before it, that didn't get a reply, fail.
+
+        :param pending: OrderedDict, with the reply counters of the commands
+            waiting for a reply as keys, in the order they were sent, and the
+            positions of their results as values.
+        :param results: List, where the results are stored.
+        :return: None.
+        """
+        self.recv_exact_reply()
+        if self.last_reply_counter not in pending:
+            print("Unexpected reply, counter:", self.last_reply_counter)
+            return
+
+        while True:
+            reply_counter, idx = pending.popitem(last=False)
+            if reply_counter == self.last_reply_counter:
+                results[idx] = self.recvd_ack()
+                return
+            print("Missing reply, counter:", reply_counter)
+
+    def upload_all_users(self, users=None, chunk_size=1024):
+        """
+        Uploads a whole users table as a single dataset, through the data
+        buffer of the device, instead of sending a command for each user.
+
+        :param users: Iterable of ZKUser, users to upload, they are stored
+            in the ZKUsers dict, see upload_users(), if it is not given,
+            the users of the ZKUsers dict are uploaded.
+        :param chunk_size: Integer, size of the data packets.
+        :return: Bool, returns True if the device saved the users.
+        """
+        if users is None:
+            users = list(self.users.values())
+        else:
+            users = [user for user in users if self.store_user(user) >= 0]
+
+        # the dataset starts with the size of the users entries, the size of
+        # the templates table and the size of the templates
+        users_dataset = bytearray(12 + 72 * len(users))
+        struct.pack_into('<III', users_dataset, 0, 72 * len(users), 0, 0)
+
+        i = 12
+        for user in users:
+            users_dataset[i:i + 72] = user.ser_user()
+            i += 72
+
+        saved = self.send_large_data(users_dataset, chunk_size)
+
+        # save the users from the buffer, only if the data was acknowledged
+        if saved:
+            self.send_command(cmd=DEFS.CMD_SAVE_USERTEMPS,
+                              data=struct.pack('<IHH', 12, 0, 8))
+            self.recv_reply()
+            saved = self.recvd_ack()
+
+        # free data buffer
+        self.send_command(cmd=DEFS.CMD_FREE_DATA)
+        self.recv_reply()
+
+        self.invalidate_cache('users', 'fptmps')
         self.refresh_data()
+        return saved
 
     def get_password(self, user_id):
         """
@@ -225,40 +346,33 @@ class DataUserMixin:
         Requests all the fingerprint templates.
 
         :return: None. Stores the templates and templates info in the
-            corresponding ZKUsers entries.
+            corresponding ZKUsers entries, if the cache is enabled and the
+            templates didn't change, the entries are kept.
         """
-        self.send_command(cmd=DEFS.CMD_DATA_WRRQ,
-                          data=bytearray.fromhex('0107000200000000000000'))
-
-        # receive the fp template dataset
-        fptemplates_dataset = self.recv_long_reply()
-        total_size_dataset = len(fptemplates_dataset)
-
-        # skip first 4 bytes (size + zeros)
-        i = 4
-        while i < total_size_dataset:
-            # extract template size
-            tmp_size = struct.unpack('<H', fptemplates_dataset[i:i + 2])[0] \
-                       - 6
-
-            # extract user serial number
-            user_sn = struct.unpack('<H', fptemplates_dataset[i + 2:i + 4])[0]
-
-            # get fingerprint index
-            fp_idx = fptemplates_dataset[i + 4]
-
-            # get fingerprint flag
-            fp_flg = fptemplates_dataset[i + 5]
-
-            # extract template
-            fp_tmp = fptemplates_dataset[i + 6: i + tmp_size]
+        hit, counters = self.lookup_cache('fptmps')
+        if hit:
+            return
 
+        for user_sn, fp_idx, fp_tmp, fp_flg in self.iter_fptmps():
             # store the template, index and type
             self.users[user_sn].set_user_fptmp(fp_index=fp_idx, fp_tmp=fp_tmp,
                                                fp_flag=fp_flg)
+        self.update_cache('fptmps', counters)
+
+    def iter_fptmps(self):
+        """
+        Requests all the fingerprint templates, the templates are decoded
+        as the dataset is received, the ZKUsers dict is not modified.
+
+        :return: Generator of tuples (user_sn, fp_index, fp_tmp, fp_flag),
+            where fp_tmp is a bytearray with the template.
+        """
+        self.send_command(cmd=DEFS.CMD_DATA_WRRQ,
+                          data=bytearray.fromhex('0107000200000000000000'))
 
-            # every template entry is 6 bytes + template length
-            i += tmp_size+6
+        # the entry size is given on the first 2 bytes
+        for fp_entry in misc.iter_records(self.iter_long_reply()):
+            yield decode_fp_entry(fp_entry)
 
     def delete_fp(self, user_id, fp_index):
         """
@@ -276,6 +390,7 @@ class DataUserMixin:
         # send the request
         self.send_command(cmd=DEFS.CMD_DEL_FPTMP, data=del_data)
         self.recv_reply()
+        self.invalidate_cache('fptmps')
 
         # refresh the device data
         self.refresh_data()
@@ -304,15 +419,36 @@ class DataUserMixin:
         :param fp: Bytearray, fingerprint template.
         :param fp_index: Integer, fingerprint index.
         :param fp_flag: Integer, fingerprint flag (duress=3, valid=1).
-        :return: None.
+        :return: Bool, returns True if the template was written, see
+            write_fp().
         """
         user_sn = self.id_to_sn(user_id)
+        if user_sn < 0:
+            print("User not found:", user_id)
+            return False
         self.disable_device()
 
+        written = self.write_fp(user_sn, fp, fp_index, fp_flag)
+
+        # refresh data
+        self.refresh_data()
+        return written
+
+    def write_fp(self, user_sn, fp, fp_index, fp_flag):
+        """
+        Writes a fingerprint template through the data buffer of the
+        device, the data isn't refreshed.
+
+        :param user_sn: Integer, user's index on machine.
+        :param fp: Bytearray, fingerprint template.
+        :param fp_index: Integer, fingerprint index.
+        :param fp_flag: Integer, fingerprint flag (duress=3, valid=1).
+        :return: Bool, returns True if the device acknowledged the write
+            request.
+        """
         # sending prep struct
-        fp_size = struct.pack('<H', len(fp))
         prep_data = bytearray([0x00]*4)
-        prep_data[0:2] = fp_size
+        prep_data[0:2] = struct.pack('<H', len(fp))
         self.send_command(cmd=DEFS.CMD_PREPARE_DATA, data=prep_data)
         self.recv_reply()
 
@@ -322,23 +458,135 @@ class DataUserMixin:
 
         # request checksum
         self.send_command(cmd=DEFS.CMD_CHECKSUM_BUFFER)
-        self.recv_reply()  # ignored
+        self.recv_reply()
+
+        # the checksum algorithm isn't confirmed, a mismatch is only
+        # reported, the write request is sent anyway
+        self.is_valid_buffer_checksum(fp)
 
         # send write request
-        tmp_wreq_data = bytearray([0x00] * 6)
-        tmp_wreq_data[0:2] = struct.pack('<H', user_sn)
-        tmp_wreq_data[2] = fp_index
-        tmp_wreq_data[3] = fp_flag
-        tmp_wreq_data[4:6] = fp_size
-        self.send_command(cmd=DEFS.CMD_TMP_WRITE, data=tmp_wreq_data)
+        self.send_command(cmd=DEFS.CMD_TMP_WRITE,
+                          data=self.tmp_write_data(user_sn, fp,
+                                                   fp_index, fp_flag))
         self.recv_reply()
+        written = self.recvd_ack()
 
         # free data buffer
         self.send_command(cmd=DEFS.CMD_FREE_DATA)
         self.recv_reply()
 
-        # refresh data
+        self.invalidate_cache('fptmps')
+        return written
+
+    def tmp_write_data(self, user_sn, fp, fp_index, fp_flag):
+        """
+        Builds the data of the CMD_TMP_WRITE command.
+
+        :param user_sn: Integer, user's index on machine.
+        :param fp: Bytearray, fingerprint template.
+        :param fp_index: Integer, fingerprint index.
+        :param fp_flag: Integer, fingerprint flag (duress=3, valid=1).
+        :return: Bytearray, write request data.
+        """
+        tmp_wreq_data = bytearray([0x00] * 6)
+        tmp_wreq_data[0:2] = struct.pack('<H', user_sn)
+        tmp_wreq_data[2] = fp_index
+        tmp_wreq_data[3] = fp_flag
+        tmp_wreq_data[4:6] = struct.pack('<H', len(fp))
+        return tmp_wreq_data
+
+    def upload_fps(self, fps):
+        """
+        Uploads several fingerprint templates, the commands are pipelined,
+        so each template needs a single round-trip: the template is sent
+        to the buffer along with the checksum request, and once the
+        checksum is received, the write request and the free data command
+        are sent along with the next template, a checksum mismatch is only
+        reported, see write_fp(). Templates whose write request fails are
+        written again one by one, the data is refreshed once at the end.
+
+        :param fps: Iterable of tuples (user_id, fp, fp_index, fp_flag),
+            see upload_fp().
+        :return: Dictionary, with tuples (user_id, fp_index) as keys and
+            True as value if the template was written.
+        """
+        results = {}
+        retries = []    # templates to upload again, one by one
+        writing = None  # template with write commands pending to reply
+
+        # the users are checked before sending any command, so the
+        # pipeline isn't broken by an unknown user
+        fp_infos = []
+        for user_id, fp, fp_index, fp_flag in fps:
+            user_sn = self.id_to_sn(user_id)
+            if user_sn < 0:
+                print("User not found:", user_id)
+                results[(user_id, fp_index)] = False
+            else:
+                fp_infos.append((user_id, user_sn, fp, fp_index, fp_flag))
+
+        self.disable_device()
+
+        for fp_info in fp_infos:
+            user_id, user_sn, fp, fp_index, fp_flag = fp_info
+
+            # send the template and request the checksum of the buffer
+            prep_data = bytearray([0x00]*4)
+            prep_data[0:2] = struct.pack('<H', len(fp))
+            for cmd, data in [(DEFS.CMD_PREPARE_DATA, prep_data),
+                              (DEFS.CMD_DATA, fp),
+                              (DEFS.CMD_CHECKSUM_BUFFER, None)]:
+                self.send_command(cmd=cmd, data=data)
+                self.reply_number += 1
+
+            # replies of the write request and free data of previous
+            # template, they were sent before this template
+            if writing is not None:
+                self.recv_pending_write(writing, results, retries)
+
+            # replies of prepare data, data and checksum
+            self.recv_exact_reply()
+            self.recv_exact_reply()
+            self.recv_exact_reply()
+
+            self.is_valid_buffer_checksum(fp)
+            tmp_wreq_data = self.tmp_write_data(user_sn, fp,
+                                                fp_index, fp_flag)
+            self.send_command(cmd=DEFS.CMD_TMP_WRITE, data=tmp_wreq_data)
+            self.reply_number += 1
+            writing = fp_info
+
+            self.send_command(cmd=DEFS.CMD_FREE_DATA)
+            self.reply_number += 1
+
+        if writing is not None:
+            self.recv_pending_write(writing, results, retries)
+
+        # fall back to upload the failed templates one by one
+        for user_id, user_sn, fp, fp_index, fp_flag in retries:
+            results[(user_id, fp_index)] = self.write_fp(
+                user_sn, fp, fp_index, fp_flag)
+
+        self.invalidate_cache('fptmps')
         self.refresh_data()
+        return results
+
+    def recv_pending_write(self, fp_info, results, retries):
+        """
+        Receives the replies to the write request and the free data
+        commands of a template, sent by upload_fps().
+
+        :param fp_info: Tuple (user_id, user_sn, fp, fp_index, fp_flag).
+        :param results: Dictionary, where the result is stored.
+        :param retries: List, where the template is added if it fails.
+        :return: None.
+        """
+        self.recv_exact_reply()
+        if self.recvd_ack():
+            results[(fp_info[0], fp_info[3])] = True
+        else:
+            retries.append(fp_info)
+        self.recv_exact_reply()
 
     def refresh_data(self):
         """
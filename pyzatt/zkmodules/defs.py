@@ -79,6 +79,7 @@ CMD_EMPTY_MIFARE = 0x004e
 CMD_VERIFY_WRQ = 0x004f
 CMD_VERIFY_RRQ = 0x0050
 CMD_TMP_WRITE = 0x0057
+CMD_SAVE_USERTEMPS = 0x006e
 CMD_CHECKSUM_BUFFER = 0x0077
 CMD_DEL_FPTMP = 0x0086
 CMD_GET_TIME = 0x00c9
@@ -50,6 +50,7 @@ class OtherMixin:
         """
         self.send_command(DEFS.CMD_CLEAR_ADMIN)
         self.recv_reply()
+        self.invalidate_cache('users')
         return self.recvd_ack()
 
     def poweroff(self):
@@ -1,6 +1,7 @@
 import struct
 import pyzatt.zkmodules.defs as DEFS
 import pyzatt.misc as misc
+from pyzatt.zkmodules.realtime import decode_event
 
 """
 This file contains provides functions to create, parse, receive and send,
@@ -10,6 +11,190 @@ Author: Alexander Marin <alexuzmarin@gmail.com>
 """
 
 
+# header fields: start tag, size (with fixed zeros), code, checksum,
+# session id and reply counter
+HEADER = struct.Struct('<4sIHHHH')
+CHECKSUM = struct.Struct('<H')
+
+
+class Packet:
+    """
+    Lightweight view of a received packet, the header fields are decoded
+    once and the payload is given as a memoryview of the packet buffer,
+    so no data is copied.
+    """
+    __slots__ = ('buf', 'start_tag', 'size', 'code', 'checksum',
+                 'session_code', 'reply_counter')
+
+    def __init__(self, zkp):
+        """
+        :param zkp: Bytes-like object, whole packet, at least 16 bytes long.
+        """
+        self.buf = memoryview(zkp)
+        (self.start_tag, self.size, self.code, self.checksum,
+         self.session_code, self.reply_counter) = HEADER.unpack_from(self.buf)
+
+    @property
+    def payload(self):
+        """
+        Data field of the packet.
+
+        :return: Memoryview, data following the header.
+        """
+        return self.buf[HEADER.size:]
+
+    def has_valid_tag(self):
+        """
+        Checks the start tag of the packet.
+
+        :return: Bool, True if the start tag matches.
+        """
+        return self.start_tag == DEFS.START_TAG
+
+    def has_valid_checksum(self):
+        """
+        Checks the checksum field of the packet.
+
+        :return: Bool, True if the checksum is consistent.
+        """
+        return misc.is_valid_payload(self.buf[8:])
+
+    @property
+    def data_size(self):
+        """
+        Size of the data field, as given by the header, only the lower 16
+        bits of the size field are used, as in PacketReader.packet_size().
+
+        :return: Int, size of the payload.
+        """
+        return max(struct.unpack_from('<H', self.buf, 4)[0] - 8, 0)
+
+
+class PacketReader:
+    """
+    Receive buffer of a session, it splits the received byte stream in
+    whole packets, the data received after a packet is kept for the next
+    read, so several packets may be received with a single syscall.
+    """
+    def __init__(self, size=4096):
+        """
+        :param size: Int, initial size of the buffer, it grows if a larger
+            packet is received.
+        """
+        self.buf = bytearray(size)
+        self.start = 0  # position of the first pending byte
+        self.end = 0    # position after the last pending byte
+
+    def __len__(self):
+        return self.end - self.start
+
+    def clear(self):
+        """
+        Drops the pending data, e.g. when the socket is replaced.
+
+        :return: None.
+        """
+        self.start = self.end = 0
+
+    def fill(self, sock):
+        """
+        Receives data from the socket into the free space of the buffer,
+        the pending data is moved to the start of the buffer when the
+        free space runs low.
+
+        :param sock: Socket object.
+        :return: Int, number of received bytes.
+        """
+        pending = len(self)
+        if pending == 0:
+            self.start = self.end = 0
+        elif len(self.buf) - self.end < len(self.buf) // 4:
+            self.buf[:pending] = self.buf[self.start:self.end]
+            self.start, self.end = 0, pending
+            if pending == len(self.buf):
+                self.buf.extend(bytes(len(self.buf)))
+
+        n = sock.recv_into(memoryview(self.buf)[self.end:])
+        if n == 0:
+            raise ConnectionError("Connection closed by the device")
+        self.end += n
+        return n
+
+    def packet_size(self):
+        """
+        Gives the size of the next packet, from its header.
+
+        :return: Int, size of the whole packet, -1 if the header wasn't
+            received yet.
+        """
+        if len(self) < 8:
+            return -1
+        return 8 + struct.unpack_from('<H', self.buf, self.start + 4)[0]
+
+    def has_packet(self):
+        """
+        Checks if a whole packet is pending.
+
+        :return: Bool, True if the next packet can be taken without
+            receiving more data.
+        """
+        return 0 <= self.packet_size() <= len(self)
+
+    def take(self, size):
+        """
+        Removes pending data from the buffer.
+
+        :param size: Int, amount of data to take, it must be pending.
+        :return: Bytearray, copy of the data.
+        """
+        data = self.buf[self.start:self.start + size]
+        self.start += size
+        return data
+
+    def read_packet(self, sock):
+        """
+        Gives the next packet, receiving data until it is complete.
+
+        :param sock: Socket object.
+        :return: Bytearray, whole packet.
+        """
+        while not self.has_packet():
+            self.fill(sock)
+        return self.take(self.packet_size())
+
+    def read_into(self, sock, view):
+        """
+        Fills a given buffer, with the pending data first, the rest is
+        received directly in the given buffer.
+
+        :param sock: Socket object.
+        :param view: Memoryview, writable buffer to fill.
+        :return: None.
+        """
+        n = min(len(self), len(view))
+        view[:n] = self.buf[self.start:self.start + n]
+        self.start += n
+
+        view = view[n:]
+        while len(view):
+            n = sock.recv_into(view)
+            if n == 0:
+                raise ConnectionError("Connection closed by the device")
+            view = view[n:]
+
+    def read_some(self, sock, max_size):
+        """
+        Gives the pending data, or receives data if there isn't any.
+
+        :param sock: Socket object.
+        :param max_size: Int, maximum amount of data to give.
+        :return: Bytearray, data.
+        """
+        if not len(self):
+            self.fill(sock)
+        return self.take(min(len(self), max_size))
+
+
 class PacketMixin:
 
     def create_packet(self, cmd_code, data=None, session_id=None,
@@ -24,44 +209,60 @@ class PacketMixin:
             the session from connection setup.
         :param reply_number: Int, reply counter, if not specified,
             the reply number is obtained from context.
-        :return:
+        :return: Bytearray, the new packet.
+        """
+        zk_packet = bytearray(HEADER.size + (len(data) if data else 0))
+        self.pack_packet(zk_packet, cmd_code, data, session_id, reply_number)
+        return zk_packet
+
+    def pack_packet(self, buf, cmd_code, data=None, session_id=None,
+                    reply_number=None):
         """
-        zk_packet = bytearray(DEFS.START_TAG)  # fixed tag
-        zk_packet.extend([0x00] * 2)  # size of payload
-        zk_packet.extend([0x00] * 2)  # fixed zeros
-        zk_packet.extend(struct.pack('<H', cmd_code))  # cmd code / reply id
-        zk_packet.extend([0x00] * 2)  # checksum field
+        Writes a packet at the start of a given buffer, the header is packed
+        in a single step and the data is copied only once.
 
-        # append session id
+        :param buf: Bytearray, destination buffer, it must be large enough
+            to hold the header and the data.
+        :param cmd_code: Int, Command/reply identifier(see defs.py).
+        :param data: Bytes-like object, data to be placed in the data field
+            of the payload.
+        :param session_id: Int, session id, if not specified, uses
+            the session from connection setup.
+        :param reply_number: Int, reply counter, if not specified,
+            the reply number is obtained from context.
+        :return: Int, length of the packet written in the buffer.
+        """
         if session_id is None:
-            zk_packet.extend(struct.pack('<H', self.session_id))
-        else:
-            zk_packet.extend(struct.pack('<H', session_id))
+            session_id = self.session_id
 
-        # append reply number
         if reply_number is None:
-            zk_packet.extend(struct.pack('<H', self.reply_number))
-        else:
-            zk_packet.extend(struct.pack('<H', reply_number))
+            reply_number = self.reply_number
+
+        data_len = len(data) if data else 0
+        pkt_len = HEADER.size + data_len
+
+        # write header with an empty checksum field, the size field doesn't
+        # include the start tag and the fixed zeros
+        HEADER.pack_into(buf, 0, DEFS.START_TAG, pkt_len - 8, cmd_code, 0,
+                         session_id, reply_number)
 
         # append additional data
-        if data:
-            zk_packet.extend(data)
+        if data_len:
+            buf[HEADER.size:pkt_len] = data
 
-        # write size field
-        zk_packet[4:6] = struct.pack('<H', len(zk_packet) - 8)
         # write checksum
-        zk_packet[10:12] = struct.pack('<H', misc.checksum16(zk_packet[8:]))
+        CHECKSUM.pack_into(
+            buf, 10, misc.checksum16(memoryview(buf)[8:pkt_len]))
 
-        return zk_packet
+        return pkt_len
 
     def recv_reply(self, buff_size=1024):
         """
-        Receives data from the device.
+        Receives a reply packet from the device.
 
-        :param buff_size: Int, maximum amount of data to receive,
-            if not specified, is set to 1024, also updates the reply number,
-            and stores fields of the packet to the attributes:
+        :param buff_size: Int, not used, kept for compatibility, also
+            updates the reply number, and stores fields of the packet to
+            the attributes:
 
             - self.last_reply_code
             - self.last_session_code
@@ -70,11 +271,19 @@ class PacketMixin:
         :return: Bytearray, received data,
             also stored in last_payload_data.
         """
-        zkp = self.soc_zk.recv(buff_size)
-        zkp = bytearray(zkp)
-        self.parse_ans(zkp)
+        self.parse_ans(self.recv_packet(buff_size))
         self.reply_number += 1
 
+    def recv_exact_reply(self):
+        """
+        Receives one packet from the device and parses it, unlike
+        recv_reply(), the reply number is not updated, so it may be used
+        when several replies are pending.
+
+        :return: Bool, returns True if the packet is valid.
+        """
+        return self.parse_ans(self.recv_packet())
+
     def recv_long_reply(self, buff_size=4096):
         """
         Receives a large dataset from the device.
@@ -92,71 +301,286 @@ class PacketMixin:
 
         if self.last_reply_code == DEFS.CMD_DATA:
             # device sent the dataset immediately, i.e. short dataset
-            dataset = self.last_payload_data
+            dataset = bytearray(self._payload_view)
 
         elif self.last_reply_code == DEFS.CMD_PREPARE_DATA:
             # seen on fp template download procedure
+            dataset = self.recv_prepared_data(buff_size)
 
-            # receives packet with long dataset
-            zkp = self.recv_packet()
-            self.parse_ans(zkp)
-            dataset = self.last_payload_data
+        elif self.last_reply_code == DEFS.CMD_ACK_OK:
+            # device sent the dataset with additional commands, i.e. longer
+            # dataset, see ex_data spec
+            size_info = self.request_dataset()
 
-            # receives the acknowledge after the dataset packet
-            self.recv_packet(buff_size)
+            # receives the data packets directly into a single buffer
+            # with the announced size of the dataset
+            dataset = bytearray(size_info)
+            offset = 0
+            while True:
+                chunk_size = self.recv_data_chunk(dataset, offset)
+                if chunk_size < 0:
+                    break
+                offset += chunk_size
+
+            # drop the unused space if the device sent less data
+            del dataset[offset:]
+
+            self.free_dataset(buff_size)
+
+        return dataset
+
+    def iter_long_reply(self, buff_size=4096):
+        """
+        Receives a large dataset from the device, the dataset is given in
+        chunks as the data packets arrive, so it may be processed while
+        the transfer is running, if the generator is closed before the end
+        of the dataset, the remaining data packets are dropped and the
+        dataset is freed, so the session stays usable.
+
+        :param buff_size: Int, maximum amount of data to receive,
+            if not specified, is set to 1024.
+        :return: Generator of bytearrays, chunks of the dataset.
+        """
+        zkp = self.recv_packet(buff_size)
+        self.parse_ans(zkp)
+        self.reply_number += 1
+
+        if self.last_reply_code == DEFS.CMD_DATA:
+            # device sent the dataset immediately, i.e. short dataset
+            yield bytearray(self._payload_view)
+
+        elif self.last_reply_code == DEFS.CMD_PREPARE_DATA:
+            # seen on fp template download procedure
+            yield self.recv_prepared_data(buff_size)
 
         elif self.last_reply_code == DEFS.CMD_ACK_OK:
             # device sent the dataset with additional commands, i.e. longer
             # dataset, see ex_data spec
-            size_info = struct.unpack('<I', self.last_payload_data[1:5])[0]
+            self.request_dataset()
+
+            stopped = False
+            try:
+                while True:
+                    chunk = bytearray()
+                    if self.recv_data_chunk(chunk) < 0:
+                        break
+                    stopped = True
+                    yield chunk
+                    stopped = False
+            finally:
+                if stopped:
+                    # the consumer stopped early, drop the pending data
+                    # packets, so they aren't taken as the next replies,
+                    # the yielded chunks may still be in use
+                    scratch = bytearray()
+                    while self.recv_data_chunk(scratch) >= 0:
+                        pass
+                self.free_dataset(buff_size)
+
+    def recv_prepared_data(self, buff_size=4096):
+        """
+        Receives the dataset that follows a CMD_PREPARE_DATA reply.
 
-            # creates data for "ready for data" command
-            rdy_struct = bytearray(4 * [0])
-            rdy_struct.extend(struct.pack('<I', size_info))
+        :param buff_size: Int, buffer size used for socket receive.
+        :return: Bytearray, received dataset.
+        """
+        # receives packet with long dataset
+        zkp = self.recv_packet()
+        self.parse_ans(zkp)
+        dataset = bytearray(self._payload_view)
 
-            self.send_command(DEFS.CMD_DATA_RDY, data=bytearray(rdy_struct))
+        # receives the acknowledge after the dataset packet
+        self.recv_packet(buff_size)
 
-            # receives the prepare data reply
-            self.recv_packet(24)
+        return dataset
 
-            # receives packet with long dataset
-            dataset = bytearray()
-            while True:
-                zkp = self.recv_packet()
-                self.parse_ans(zkp)
-                if (self.last_reply_code == DEFS.CMD_DATA):
-                    dataset += self.last_payload_data
-                else:
-                    break
+    def request_dataset(self):
+        """
+        Requests the transfer of the announced dataset, it should be called
+        after receiving the CMD_ACK_OK reply with the dataset size.
 
-            # increment reply number and send "free data" command
-            self.reply_number += 1
-            self.send_command(DEFS.CMD_FREE_DATA)
+        :return: Int, size of the dataset.
+        """
+        size_info = struct.unpack('<I', self.last_payload_data[1:5])[0]
 
-            # receive acknowledge
-            self.recv_packet(buff_size)
+        # creates data for "ready for data" command
+        rdy_struct = bytearray(4 * [0])
+        rdy_struct.extend(struct.pack('<I', size_info))
 
-            # update reply counter
-            self.reply_number += 1
+        self.send_command(DEFS.CMD_DATA_RDY, data=bytearray(rdy_struct))
 
-        return dataset
+        # receives the prepare data reply
+        self.recv_packet(24)
 
-    def recv_packet(self, buff_size=4096):
+        return size_info
+
+    def free_dataset(self, buff_size=4096):
         """
-        Receives a packet from the device.
+        Frees the dataset buffer on the device, it should be called after
+        receiving the data packets.
 
         :param buff_size: Int, buffer size used for socket receive.
-        :return: Bytearray, received data.
+        :return: None.
+        """
+        # increment reply number and send "free data" command
+        self.reply_number += 1
+        self.send_command(DEFS.CMD_FREE_DATA)
+
+        # receive acknowledge
+        self.recv_packet(buff_size)
+
+        # update reply counter
+        self.reply_number += 1
+
+    def send_large_data(self, data, chunk_size=1024):
+        """
+        Sends a large dataset to the data buffer of the device, the size of
+        the dataset is sent first, then the data in several packets and
+        finally the checksum of the buffer is requested.
+
+        :param data: Bytes-like object, dataset to send.
+        :param chunk_size: Integer, maximum size of the data packets.
+        :return: Bool, returns True if the device acknowledged
+            every packet, a mismatch of the checksum of the buffer is only
+            reported, see is_valid_buffer_checksum().
+        """
+        self.send_command(cmd=DEFS.CMD_PREPARE_DATA,
+                          data=struct.pack('<I', len(data)))
+        self.recv_reply()
+        ack = self.recvd_ack()
+
+        # the packets are sent from views of the dataset
+        data = memoryview(data)
+        for i in range(0, len(data), chunk_size):
+            self.send_command(cmd=DEFS.CMD_DATA, data=data[i:i + chunk_size])
+            self.recv_reply()
+            ack = ack and self.recvd_ack()
+
+        # request checksum
+        self.send_command(cmd=DEFS.CMD_CHECKSUM_BUFFER)
+        self.recv_reply()
+        self.is_valid_buffer_checksum(data)
+
+        return ack
+
+    def is_valid_buffer_checksum(self, data):
+        """
+        Checks the reply to the CMD_CHECKSUM_BUFFER command, against the
+        checksum of the data sent to the buffer, the algorithm of the
+        checksum isn't confirmed on a device, so a mismatch is reported but
+        it doesn't stop the uploads.
+
+        :param data: Bytes-like object, data sent to the buffer.
+        :return: Bool, True if the checksum given by the device matches.
+        """
+        if not self.recvd_ack() or len(self.last_payload_data) < 4:
+            print("Checksum of the buffer not received")
+            return False
+        buff_chk = struct.unpack('<I', self.last_payload_data[0:4])[0]
+        if buff_chk != misc.buffer_checksum(data):
+            print("Checksum of the buffer doesn't match: %08x" % buff_chk)
+            return False
+        return True
+
+    def recv_packet(self, buff_size=4096):
         """
-        zkp = self.recv_data(buff_size)
-        # extracts size of the total packet
-        total_size = 8 + struct.unpack('<H', zkp[4:6])[0]
-        rem_recv = total_size - len(zkp)
-        # keeps reading until it receives the complete packet
-        while len(zkp) < total_size:
-            zkp += self.recv_data(rem_recv)
-            rem_recv = total_size - len(zkp)
-        return zkp
+        Receives exactly one packet from the device, the data received
+        after the packet is kept in the receive buffer for the next read.
+
+        :param buff_size: Int, not used, kept for compatibility.
+        :return: Bytearray, received packet.
+        """
+        return self.recv_buffer.read_packet(self.soc_zk)
+
+    def recv_data_chunk(self, dataset, offset=0):
+        """
+        Receives a packet of a large dataset, the payload of a CMD_DATA
+        packet is received directly in the given buffer, any other packet
+        is parsed as usual, see parse_ans().
+
+        :param dataset: Bytearray, buffer where the payload is stored, it
+            grows if it can't hold the payload at the given offset.
+        :param offset: Int, position of the buffer where the payload
+            is written.
+        :return: Int, number of bytes written in the dataset, returns -1 if
+            the packet doesn't have a valid CMD_DATA payload.
+        """
+        header = bytearray(HEADER.size)
+        self.recv_exact(memoryview(header))
+        pkt = Packet(header)
+
+        if not pkt.has_valid_tag():
+            # the size field can't be trusted, nothing else is received
+            self.parse_ans(header)
+            return -1
+
+        chunk = self.data_chunk_view(pkt, dataset, offset)
+        if chunk is None:
+            # not a data packet, receive the rest of it and parse it
+            zkp = header + bytes(pkt.data_size)
+            self.recv_exact(memoryview(zkp)[HEADER.size:])
+            self.parse_ans(zkp)
+            return -1
+
+        self.recv_exact(chunk)
+        return self.check_data_chunk(pkt, chunk)
+
+    def data_chunk_view(self, pkt, dataset, offset):
+        """
+        Gives the part of a dataset buffer where the payload of a data
+        packet is received, see recv_data_chunk().
+
+        :param pkt: Packet, view of the header of the packet.
+        :param dataset: Bytearray, dataset buffer, it grows if it can't hold
+            the payload at the given offset.
+        :param offset: Int, position of the payload in the buffer.
+        :return: Memoryview of the buffer, or None if the packet is not a
+            CMD_DATA packet.
+        """
+        if not pkt.has_valid_tag() or pkt.code != DEFS.CMD_DATA:
+            return None
+
+        data_size = pkt.data_size
+        if len(dataset) < offset + data_size:
+            dataset.extend(bytes(offset + data_size - len(dataset)))
+        return memoryview(dataset)[offset:offset + data_size]
+
+    def check_data_chunk(self, pkt, chunk):
+        """
+        Checks a data packet whose payload was received in a dataset
+        buffer and stores its fields, as done by parse_ans(), the view of
+        the payload is released.
+
+        :param pkt: Packet, view of the header of the packet.
+        :param chunk: Memoryview, received payload, see data_chunk_view().
+        :return: Int, size of the payload, returns -1 if the checksum is
+            invalid.
+        """
+        # checksum of the packet, without copying the payload
+        chk = misc.Checksum16(pkt.buf[8:])
+        chk.update(chunk)
+        data_size = len(chunk)
+        chunk.release()
+
+        self.last_reply_code = pkt.code
+        self.last_session_code = pkt.session_code
+        self.last_reply_counter = pkt.reply_counter
+
+        if chk.digest() != 0:
+            print("Invalid checksum")
+            self.last_reply_code = -1
+            return -1
+
+        return data_size
+
+    def recv_exact(self, view):
+        """
+        Receives data from the device until the given buffer is full.
+
+        :param view: Memoryview, writable buffer to fill.
+        :return: None.
+        """
+        self.recv_buffer.read_into(self.soc_zk, view)
 
     def recv_data(self, buff_size=4096):
         """
@@ -166,19 +590,59 @@ class PacketMixin:
             if not specified, is set to 1024.
         :return: Bytearray, received data.
         """
-        return bytearray(self.soc_zk.recv(buff_size))
+        return self.recv_buffer.read_some(self.soc_zk, buff_size)
 
     def recv_event(self):
         """
         Receives an event from the machine and sends an acknowledge reply.
 
-        :return: None,
-            stores the code of the event in the last_event_code variable,
-            it also stores the data contents in the last_payload_data variable.
+        :return: Event object, decoded event, see realtime.decode_event(),
+            it's also stored in the last_event variable, the code of the
+            event is stored in the last_event_code variable and the data
+            contents in the last_payload_data variable.
         """
-        self.parse_ans(self.recv_packet())
+        event = self.parse_event(self.recv_packet())
+        self.ack_events()
+        return event
+
+    def recv_events(self):
+        """
+        Receives the pending events, it blocks until an event is received,
+        then takes every event already in the receive buffer, so a burst
+        of events is received with a single syscall, the events are
+        acknowledged at once.
+
+        :return: List of event objects, see recv_event().
+        """
+        events = [self.parse_event(self.recv_packet())]
+        while self.recv_buffer.has_packet():
+            events.append(self.parse_event(self.recv_packet()))
+        self.ack_events(len(events))
+        return events
+
+    def parse_event(self, zkp):
+        """
+        Parses an event packet, see recv_event().
+
+        :param zkp: Bytearray, event packet.
+        :return: Event object, see realtime.decode_event().
+        """
+        self.parse_ans(zkp)
         self.last_event_code = self.last_session_code
-        self.send_packet(self.create_packet(DEFS.CMD_ACK_OK, reply_number=0))
+        self.last_event = decode_event(self.last_event_code,
+                                       self._payload_view)
+        return self.last_event
+
+    def ack_events(self, count=1):
+        """
+        Sends the acknowledge replies of a number of events, in a single
+        send.
+
+        :param count: Int, number of received events.
+        :return: None.
+        """
+        self.send_packet(self.create_packet(DEFS.CMD_ACK_OK,
+                                            reply_number=0) * count)
 
     def get_last_packet(self):
         """
@@ -198,16 +662,25 @@ class PacketMixin:
             of the payload.
         :return: None.
         """
-        self.send_packet(self.create_packet(cmd, data))
+        pkt_len = HEADER.size + (len(data) if data else 0)
+
+        # reuse the send buffer of the session, it only grows when a
+        # larger packet is needed
+        if len(self.send_buffer) < pkt_len:
+            self.send_buffer = bytearray(max(pkt_len,
+                                             2 * len(self.send_buffer)))
+
+        self.pack_packet(self.send_buffer, cmd, data)
+        self.send_packet(memoryview(self.send_buffer)[:pkt_len])
 
     def send_packet(self, zkp):
         """
         Sends a given complete packet.
 
-        :param zkp: Bytearray, packet to send.
+        :param zkp: Bytes-like object, packet to send.
         :return: None.
         """
-        self.soc_zk.send(zkp)
+        self.soc_zk.sendall(zkp)
 
     def parse_ans(self, zkp):
         """
@@ -217,7 +690,11 @@ class PacketMixin:
         - self.last_reply_code
         - self.last_session_code
         - self.last_reply_counter
-        - self.last_payload_data
+        - self.last_payload_data, copy of the packet payload.
+
+        The payload is also kept as a memoryview of the packet, in the
+        _payload_view attribute, so it is decoded internally without
+        copying.
 
         :param zkp: Bytearray, packet.
         :return: Bool, returns True if the packet is valid, False otherwise.
@@ -225,18 +702,25 @@ class PacketMixin:
         self.last_reply_code = -1
         self.last_session_code = -1
         self.last_reply_counter = -1
-        self.last_payload_data = bytearray([])
+        self.last_payload_data = b''
+        self._payload_view = memoryview(b'')
+
+        if len(zkp) < HEADER.size:
+            print("Incomplete packet")
+            return False
+
+        pkt = Packet(zkp)
 
         # check the start tag
-        if not zkp[0:4] == DEFS.START_TAG:
+        if not pkt.has_valid_tag():
             print("Bad start tag")
             return False
 
         # extracts size of packet
-        self.last_reply_size = struct.unpack('<I', zkp[4:8])[0]
+        self.last_reply_size = pkt.size
 
         # checks the checksum field
-        if not misc.is_valid_payload(zkp[8:]):
+        if not pkt.has_valid_checksum():
             print("Invalid checksum")
             return False
 
@@ -244,13 +728,17 @@ class PacketMixin:
 
         self.last_packet = zkp
 
-        self.last_reply_code = struct.unpack('<H', zkp[8:10])[0]
+        self.last_reply_code = pkt.code
+
+        self.last_session_code = pkt.session_code
+
+        self.last_reply_counter = pkt.reply_counter
 
-        self.last_session_code = struct.unpack('<H', zkp[12:14])[0]
+        self._payload_view = pkt.payload
 
-        self.last_reply_counter = struct.unpack('<H', zkp[14:16])[0]
+        self.last_payload_data = bytes(self._payload_view)
 
-        self.last_payload_data = zkp[16:]
+        return True
 
     def recvd_ack(self):
         """
@@ -1,4 +1,8 @@
+import collections
+import datetime
+import socket
 import struct
+import threading
 import pyzatt.zkmodules.defs as DEFS
 
 """
@@ -9,18 +13,320 @@ Author: Alexander Marin <alexuzmarin@gmail.com>
 """
 
 
+# layouts of the event payloads
+ATTLOG_EVENT = struct.Struct('<9s15xH6B')
+ALARM_EVENT = struct.Struct('<I')
+DURESS_EVENT = struct.Struct('<IHHI')
+ENROLL_FP_EVENT = struct.Struct('<HH9sB')
+FPFTR_EVENT = struct.Struct('<B')
+VERIFY_EVENT = struct.Struct('<IB')
+
+
+class RawEvent(collections.namedtuple('RawEvent', ['code', 'data'])):
+    """
+    Event without a decoder, or with an invalid payload, data is a copy
+    of the payload.
+    """
+    __slots__ = ()
+
+
+class AttLogEvent(collections.namedtuple(
+        'AttLogEvent', ['user_id', 'ver_type', 'att_time'])):
+    """
+    Attendance event, the verification type may be password=0, fp=1 or
+    rfid=2, and att_time is a datetime object.
+    """
+    __slots__ = ()
+    code = DEFS.EF_ATTLOG
+
+
+class AlarmEvent(collections.namedtuple(
+        'AlarmEvent', ['alarm_type', 'duress_type', 'user_sn',
+                       'match_type'])):
+    """
+    Alarm event, the last fields are only given on duress alarms, they are
+    None otherwise.
+    """
+    __slots__ = ()
+    code = DEFS.EF_ALARM
+
+
+class EnrollFingerEvent(collections.namedtuple(
+        'EnrollFingerEvent', ['success', 'user_id', 'fp_index',
+                              'fp_size'])):
+    """
+    Enrolled fingerprint event.
+    """
+    __slots__ = ()
+    code = DEFS.EF_ENROLLFINGER
+
+
+class FingerScoreEvent(collections.namedtuple('FingerScoreEvent',
+                                              ['score'])):
+    """
+    Score of a fingerprint sample in an enrolling procedure, 100(valid)
+    or 0(invalid).
+    """
+    __slots__ = ()
+    code = DEFS.EF_FPFTR
+
+
+class VerifyEvent(collections.namedtuple('VerifyEvent',
+                                         ['user_sn', 'flag'])):
+    """
+    Verify event, with the user internal index.
+    """
+    __slots__ = ()
+    code = DEFS.EF_VERIFY
+
+
+def decode_id(raw_id):
+    """
+    Decodes a user ID field, padded with zeros.
+
+    :param raw_id: Bytes, ID field.
+    :return: String, user ID.
+    """
+    return raw_id.replace(b'\x00', b'').decode('ascii')
+
+
+def decode_attlog_event(payload):
+    """
+    Decodes the payload of an EF_ATTLOG event.
+
+    :param payload: Bytes-like object, event payload.
+    :return: AttLogEvent.
+    """
+    user_id, ver_type, year, month, day, hour, mins, secs = \
+        ATTLOG_EVENT.unpack_from(payload)
+    return AttLogEvent(decode_id(user_id), ver_type, datetime.datetime(
+        2000 + year, month, day, hour, mins, secs))
+
+
+def decode_alarm_event(payload):
+    """
+    Decodes the payload of an EF_ALARM event.
+
+    :param payload: Bytes-like object, event payload.
+    :return: AlarmEvent.
+    """
+    if len(payload) >= DURESS_EVENT.size:
+        return AlarmEvent(*DURESS_EVENT.unpack_from(payload))
+    return AlarmEvent(ALARM_EVENT.unpack_from(payload)[0], None, None, None)
+
+
+def decode_enroll_fp_event(payload):
+    """
+    Decodes the payload of an EF_ENROLLFINGER event.
+
+    :param payload: Bytes-like object, event payload.
+    :return: EnrollFingerEvent.
+    """
+    result, fp_size, user_id, fp_index = ENROLL_FP_EVENT.unpack_from(payload)
+    return EnrollFingerEvent(result == 0, decode_id(user_id), fp_index,
+                             fp_size)
+
+
+def decode_fpftr_event(payload):
+    """
+    Decodes the payload of an EF_FPFTR event.
+
+    :param payload: Bytes-like object, event payload.
+    :return: FingerScoreEvent.
+    """
+    return FingerScoreEvent(*FPFTR_EVENT.unpack_from(payload))
+
+
+def decode_verify_event(payload):
+    """
+    Decodes the payload of an EF_VERIFY event.
+
+    :param payload: Bytes-like object, event payload.
+    :return: VerifyEvent.
+    """
+    return VerifyEvent(*VERIFY_EVENT.unpack_from(payload))
+
+
+# decoders of the event payloads, the key is the event code
+EVENT_DECODERS = {
+    DEFS.EF_ATTLOG: decode_attlog_event,
+    DEFS.EF_ALARM: decode_alarm_event,
+    DEFS.EF_ENROLLFINGER: decode_enroll_fp_event,
+    DEFS.EF_FPFTR: decode_fpftr_event,
+    DEFS.EF_VERIFY: decode_verify_event
+}
+
+
+def decode_event(event_code, payload):
+    """
+    Decodes the payload of an event.
+
+    :param event_code: Integer, event code, as given on the session id field.
+    :param payload: Bytes-like object, payload of the event packet.
+    :return: Event object, e.g. AttLogEvent, if there isn't a decoder for
+        the event or the payload is invalid, returns a RawEvent.
+    """
+    decoder = EVENT_DECODERS.get(event_code)
+    if decoder is not None:
+        try:
+            return decoder(payload)
+        except (struct.error, ValueError):
+            pass
+    return RawEvent(event_code, bytes(payload))
+
+
+class EventBuffer:
+    """
+    Bounded buffer of events, the overflow policy selects what happens when
+    an event arrives and the buffer is full:
+
+    - 'block': the event is rejected, the producer should wait.
+    - 'drop_oldest': the oldest event is dropped.
+    - 'coalesce': the newest queued event with the same code is replaced,
+      if there isn't any, the oldest event is dropped.
+    """
+    policies = ('block', 'drop_oldest', 'coalesce')
+
+    def __init__(self, maxsize=64, overflow='block'):
+        """
+        :param maxsize: Integer, maximum number of queued events.
+        :param overflow: String, overflow policy, see the class docstring.
+        """
+        if overflow not in self.policies:
+            raise ValueError("Invalid overflow policy: {0}".format(overflow))
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.events = collections.deque()
+
+    def __len__(self):
+        return len(self.events)
+
+    def push(self, event):
+        """
+        Adds an event to the buffer, applying the overflow policy.
+
+        :param event: Event object, see decode_event().
+        :return: Bool, returns False if the event was rejected.
+        """
+        if len(self.events) < self.maxsize:
+            self.events.append(event)
+            return True
+
+        if self.overflow == 'block':
+            return False
+
+        if self.overflow == 'coalesce':
+            for i in range(len(self.events) - 1, -1, -1):
+                if self.events[i].code == event.code:
+                    self.events[i] = event
+                    return True
+
+        self.events.popleft()
+        self.events.append(event)
+        return True
+
+    def pop(self):
+        """
+        Removes and returns the oldest event.
+
+        :return: Event object.
+        """
+        return self.events.popleft()
+
+
 class RealtimeMixin:
 
-    def enable_realtime(self):
+    def enable_realtime(self, ef_mask=0xffff):
         """
         Sends command to enable realtime events.
 
+        :param ef_mask: Integer, mask of the events to report, built with
+            the EF_* codes, e.g. EF_ATTLOG | EF_ALARM, by default every
+            event is reported.
         :return: None.
         """
         self.send_command(cmd=DEFS.CMD_REG_EVENT,
-                          data=bytearray([0xff, 0xff, 0x00, 0x00]))
+                          data=bytearray(struct.pack('<I', ef_mask)))
         self.recv_reply()
 
+    def events(self, ef_mask=0xffff, maxsize=64, overflow='block',
+               poll_interval=0.5):
+        """
+        Enables the realtime events and gives them as they arrive, the
+        events are received by a thread and kept in a bounded buffer, the
+        session shouldn't be used for other commands while iterating.
+
+        :param ef_mask: Integer, mask of the events to report, see
+            enable_realtime(), other events are ignored.
+        :param maxsize: Integer, maximum number of queued events.
+        :param overflow: String, overflow policy of the buffer, 'block',
+            'drop_oldest' or 'coalesce', see EventBuffer.
+        :param poll_interval: Float, time in seconds between the checks
+            of the stop flag, when the generator is closed, it's used as
+            the timeout of the socket while the events are received.
+        :return: Generator of event objects, see decode_event().
+        """
+        buffer = EventBuffer(maxsize, overflow)
+        self.enable_realtime(ef_mask)
+
+        cond = threading.Condition()
+        stop = threading.Event()
+        errors = []
+
+        def receive():
+            # short timeout, so the stop flag is checked even if the device
+            # is silent or has sent part of a packet
+            timeout = self.soc_zk.gettimeout()
+            self.soc_zk.settimeout(poll_interval)
+            try:
+                while not stop.is_set():
+                    # wait for a whole event, the data received so far is
+                    # kept in the receive buffer
+                    if not self.recv_buffer.has_packet():
+                        try:
+                            self.recv_buffer.fill(self.soc_zk)
+                        except socket.timeout:
+                            continue
+                        if not self.recv_buffer.has_packet():
+                            continue
+                    for event in self.recv_events():
+                        if not event.code & ef_mask:
+                            continue
+                        with cond:
+                            # with the block policy, wait for the consumer
+                            while not buffer.push(event):
+                                if stop.is_set():
+                                    return
+                                cond.wait(poll_interval)
+                            cond.notify_all()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                self.soc_zk.settimeout(timeout)
+                with cond:
+                    stop.set()
+                    cond.notify_all()
+
+        receiver = threading.Thread(target=receive, daemon=True)
+        receiver.start()
+
+        try:
+            while True:
+                with cond:
+                    while not len(buffer) and not stop.is_set():
+                        cond.wait()
+                    if not len(buffer):
+                        break
+                    event = buffer.pop()
+                    cond.notify_all()
+                yield event
+        finally:
+            stop.set()
+            receiver.join()
+
+        if errors:
+            raise errors[0]
+
     def get_last_event(self):
         """
         Returns the last event code.
@@ -13,13 +13,15 @@ Author: Alexander Marin <alexuzmarin@gmail.com>
 
 class TerminalMixin:
 
-    def connect_net(self, ip_addr, dev_port):
+    def connect_net(self, ip_addr, dev_port, timeout=None):
         """
         Connects to the machine, sets the socket connection and inits session
         by sending the connect command.
 
         :param ip_addr: String, ip address of the device.
         :param dev_port: Int, port number.
+        :param timeout: Float, timeout of the socket in seconds, if it is
+            None, the socket waits without a limit.
         :return: Bool, returns True if connection is successful,
             otherwise it returns False, also sets
             the flag self.connected_flg if
@@ -28,7 +30,9 @@ class TerminalMixin:
 
         # connects to machine
         self.soc_zk = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.soc_zk.settimeout(timeout)
         self.soc_zk.connect((ip_addr, dev_port))
+        self.recv_buffer.clear()
 
         # send connect command
         self.send_command(DEFS.CMD_CONNECT)
@@ -114,6 +118,10 @@ class TerminalMixin:
                 print("Failed to read field: {0}".format(k))
                 stat_keys[k] = -1
 
+        # limit the allocation of users indexes to the device capacity
+        if stat_keys.get('user_capacity', -1) > 0:
+            self.sn_allocator.capacity = stat_keys['user_capacity']
+
         return stat_keys
 
     def read_status(self, p):
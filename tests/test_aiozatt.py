@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+import asyncio
+import datetime
+import socket
+import struct
+import pyzatt.pyzatt as pyzatt
+import pyzatt.zkmodules.defs as DEFS
+from pyzatt.aiozatt import AsyncZKSS
+from tests.test_packet import device_replies, run_device
+from tests.test_datasets import make_users, att_record
+
+"""
+Test script to check the asyncio session, the replies of the device are
+simulated, so these tests don't require a device.
+"""
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def async_session(sock):
+    z = AsyncZKSS()
+    z.reader, z.writer = await asyncio.open_connection(sock=sock)
+    return z
+
+
+def with_size(entries):
+    return struct.pack('<I', len(entries)) + entries
+
+
+def test_read_datasets():
+    users = make_users(30)
+    users_dataset = with_size(b''.join(u.ser_user() for u in users))
+    t0 = datetime.datetime(2020, 3, 6, 8, 30, 15)
+    records = [(sn % 7, str(sn), 1, t0 + datetime.timedelta(minutes=sn), 0)
+               for sn in range(100)]
+    att_dataset = with_size(b''.join(att_record(*r) for r in records))
+
+    # two devices, read at the same time
+    socks = [socket.socketpair() for _ in range(2)]
+    threads = [run_device(dev, device_replies(users_dataset, 500) +
+                          device_replies(att_dataset, 1024))
+               for _, dev in socks]
+
+    async def read_device(sock):
+        z = await async_session(sock)
+        await z.read_all_user_id()
+        await z.read_att_log()
+        z.writer.close()
+        return z
+
+    async def read_all():
+        return await asyncio.gather(*[read_device(s) for s, _ in socks])
+
+    for z in run(read_all()):
+        assert [u.user_id for u in z.users.values()] == \
+            [u.user_id for u in users]
+        assert [e.att_time for e in z.att_log] == [r[3] for r in records]
+
+    for th in threads:
+        th.join()
+    for _, dev in socks:
+        dev.close()
+
+
+def test_recv_event():
+    sock, dev = socket.socketpair()
+    dev_z = pyzatt.ZKSS()
+    dev_z.session_id = DEFS.EF_FINGER
+    dev.sendall(dev_z.create_packet(DEFS.CMD_REG_EVENT, bytearray(b'\x01')))
+
+    async def recv():
+        z = await async_session(sock)
+        await z.recv_event()
+        z.writer.close()
+        return z
+
+    z = run(recv())
+    assert z.last_event_code == DEFS.EF_FINGER
+    assert dev_z.parse_ans(bytearray(dev.recv(4096)))
+    assert dev_z.recvd_ack()
+    dev.close()
+
+
+def test_recv_data_chunk_bad_tag():
+    sock, dev = socket.socketpair()
+    dev_z = pyzatt.ZKSS()
+    bad = dev_z.create_packet(DEFS.CMD_DATA)
+    bad[0:8] = struct.pack('<4sI', b'\x00' * 4, 0xffffffff)
+    data = dev_z.create_packet(DEFS.CMD_DATA, bytearray(range(100)))
+    dev.sendall(bad + data)
+
+    async def recv():
+        z = await async_session(sock)
+        z.timeout = 1
+        dataset = bytearray()
+        # the announced size of a bad packet isn't received
+        assert await z.recv_data_chunk(dataset) == -1
+        assert await z.recv_data_chunk(dataset) == 100
+        z.writer.close()
+        return dataset
+
+    assert run(recv()) == bytearray(range(100))
+    dev.close()
+
+
+def test_timeout():
+    sock, dev = socket.socketpair()
+
+    async def recv():
+        z = await async_session(sock)
+        z.timeout = 0.1
+        try:
+            await z.get_device_time()
+        except asyncio.TimeoutError:
+            pass
+        else:
+            assert False
+
+        # the events are waited without a time limit
+        loop = asyncio.get_event_loop()
+        dev_z = pyzatt.ZKSS()
+        dev_z.session_id = DEFS.EF_FINGER
+        loop.call_later(0.3, dev.sendall, dev_z.create_packet(
+            DEFS.CMD_REG_EVENT, bytearray(b'\x01')))
+        await z.recv_event()
+        z.writer.close()
+        return z
+
+    z = run(recv())
+    assert z.last_event_code == DEFS.EF_FINGER
+    dev.close()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+import datetime
+import pyzatt.misc as misc
+import pyzatt.pyzatt as pyzatt
+from pyzatt.archive import AttArchive
+
+"""
+Test script to check the attendance archive, these tests don't require a
+device.
+"""
+
+
+def make_att_log(t0, count):
+    att_log = pyzatt.AttendanceLog()
+    for i in range(count):
+        att_log.append_fields(i % 5, str(100 + i % 5), 1,
+                              misc.encode_time_value(
+                                  t0 + datetime.timedelta(minutes=7 * i)),
+                              i % 2)
+    return att_log
+
+
+def test_archive(tmp_path):
+    path = str(tmp_path / 'att.zkat')
+    t0 = datetime.datetime(2020, 1, 30, 22, 0, 0)
+    att_log = make_att_log(t0, 500)
+
+    with AttArchive(path) as archive:
+        assert len(archive) == 0
+        assert list(archive) == []
+        archive.append(att_log[:200])
+        archive.append(att_log[200:])
+        assert len(archive) == 500
+
+    # reopen the archive
+    with AttArchive(path) as archive:
+        assert len(archive) == 500
+        for entry, expected in zip(archive, att_log):
+            assert (entry.user_sn, entry.user_id, entry.att_time) == \
+                (expected.user_sn, expected.user_id, expected.att_time)
+
+        start = t0 + datetime.timedelta(minutes=7 * 100)
+        end = t0 + datetime.timedelta(minutes=7 * 250 + 1)
+        assert archive.bisect(start) == 100
+        assert archive.bisect(end) == 251
+        assert archive.bisect(t0 - datetime.timedelta(days=1)) == 0
+        assert archive.bisect(t0 + datetime.timedelta(days=365)) == 500
+
+        att_range = archive.read_range(start, end)
+        assert len(att_range) == 151
+        assert list(att_range.att_times) == list(att_log.att_times[100:251])
+
+
+def test_archive_append_while_reading(tmp_path):
+    path = str(tmp_path / 'att.zkat')
+    t0 = datetime.datetime(2020, 1, 30, 22, 0, 0)
+    att_log = make_att_log(t0, 300)
+
+    with AttArchive(path) as archive:
+        archive.append(att_log[:100])
+
+        # the range being read keeps the entries it had when it started
+        read = []
+        for i, entry in enumerate(archive.iter_raw()):
+            read.append(entry[3])
+            if i % 10 == 0:
+                archive.append(att_log[100 + i:110 + i])
+        assert read == list(att_log.att_times[:100])
+        assert len(archive) == 200
+
+        entries = iter(archive)
+        next(entries)
+        archive.append(att_log[200:])
+        assert len(archive) == 300
+        assert len(list(entries)) == 199
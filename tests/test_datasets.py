@@ -0,0 +1,522 @@
+#!/usr/bin/env python
+
+import datetime
+import socket
+import struct
+import pytest
+import pyzatt.misc as misc
+import pyzatt.pyzatt as pyzatt
+import pyzatt.zkmodules.defs as DEFS
+from tests.test_packet import device_replies, run_device, \
+    run_ack_device
+
+"""
+Test script to check the decoding of the datasets, the replies of the
+device are simulated, so these tests don't require a device.
+"""
+
+
+def make_users(n):
+    users = []
+    for sn in range(1, n + 1):
+        user = pyzatt.ZKUser()
+        user.set_user_info(user_sn=sn, user_id=str(1000 + sn),
+                           name="User %i" % sn, password=str(sn),
+                           card_no=sn * 7, admin_lv=sn % 2,
+                           neg_enabled=0, user_group=1, user_tzs=[1, 2, 3])
+        users += [user]
+    return users
+
+
+def att_record(user_sn, user_id, ver_type, att_time, ver_state):
+    record = bytearray(40)
+    record[0:2] = struct.pack('<H', user_sn)
+    record[2:2 + len(user_id)] = user_id.encode()
+    record[26] = ver_type
+    record[27:31] = misc.encode_time(att_time)
+    record[31] = ver_state
+    return record
+
+
+def fp_record(user_sn, fp_idx, fp_flg, fp_tmp):
+    return struct.pack('<HHBB', len(fp_tmp) + 6, user_sn, fp_idx, fp_flg) + \
+        fp_tmp
+
+
+def session_with(dataset, chunk_size=1000):
+    z = pyzatt.ZKSS()
+    z.soc_zk, dev = socket.socketpair()
+    th = run_device(dev, device_replies(dataset, chunk_size))
+    return z, dev, th
+
+
+def test_read_all_user_id():
+    users = make_users(50)
+    entries = b''.join(u.ser_user() for u in users)
+    dataset = struct.pack('<I', len(entries)) + entries
+
+    z, dev, th = session_with(dataset, 1001)
+    z.read_all_user_id()
+    th.join()
+
+    assert sorted(z.users) == [u.user_sn for u in users]
+    for user in users:
+        zuser = z.users[user.user_sn]
+        assert zuser.user_id == user.user_id
+        assert zuser.user_name == user.user_name
+        assert zuser.user_password == user.user_password
+        assert zuser.card_number == user.card_number
+        assert zuser.admin_level == user.admin_level
+        assert zuser.user_tzs == user.user_tzs
+        assert z.id_to_sn(user.user_id) == user.user_sn
+        assert z.card_to_sn(user.card_number) == user.user_sn
+    assert z.id_to_sn('no user') == -1
+    assert not z.id_exists('no user')
+    dev.close()
+
+
+def test_read_all_fptmp():
+    users = make_users(3)
+    fps = [(1, 0, 1, bytes(range(200))), (2, 5, 3, bytes(range(100, 255))),
+           (3, 9, 1, bytes(1500))]
+    entries = b''.join(fp_record(*fp) for fp in fps)
+    dataset = struct.pack('<I', len(entries)) + entries
+
+    z, dev, th = session_with(dataset, 512)
+    z.users = {u.user_sn: u for u in users}
+    z.read_all_fptmp()
+    th.join()
+
+    for user_sn, fp_idx, fp_flg, fp_tmp in fps:
+        assert z.users[user_sn].user_fptmps[fp_idx] == [fp_tmp, fp_flg]
+    dev.close()
+
+
+def test_read_att_log():
+    t0 = datetime.datetime(2020, 3, 6, 8, 30, 15)
+    records = [(sn % 7, str(sn), 1, t0 + datetime.timedelta(minutes=sn), 0)
+               for sn in range(300)]
+    entries = b''.join(att_record(*r) for r in records)
+    dataset = struct.pack('<I', len(entries)) + entries
+
+    z, dev, th = session_with(dataset, 1024)
+    z.read_att_log()
+    th.join()
+
+    assert len(z.att_log) == len(records)
+    for att_entry, record in zip(z.att_log, records):
+        assert (att_entry.user_sn, att_entry.user_id, att_entry.ver_type,
+                att_entry.att_time, att_entry.ver_state) == record
+    dev.close()
+
+
+def test_read_new_att_log():
+    t0 = datetime.datetime(2020, 3, 6, 8, 30, 15)
+    records = [(sn % 7, str(sn), 1, t0 + datetime.timedelta(minutes=sn), 0)
+               for sn in range(120)]
+
+    def att_dataset(recs):
+        entries = b''.join(att_record(*r) for r in recs)
+        return struct.pack('<I', len(entries)) + entries
+
+    def status_reply(att_count):
+        status = bytearray(80)
+        struct.pack_into('<I', status, DEFS.STATUS['attlog_count'],
+                         att_count)
+        return pyzatt.ZKSS().create_packet(DEFS.CMD_ACK_OK, status)
+
+    # first download, every entry is new
+    z, dev, th = session_with(att_dataset(records[:100]), 1024)
+    new_entries = z.read_new_att_log()
+    th.join()
+    assert len(new_entries) == 100
+    assert z.att_watermark[0] == 100
+
+    # no new entries, the log isn't transferred
+    th = run_device(dev, [status_reply(100)])
+    assert len(z.read_new_att_log()) == 0
+    th.join()
+
+    # new entries appended
+    th = run_device(dev, [status_reply(120)] +
+                    device_replies(att_dataset(records), 1024))
+    new_entries = z.read_new_att_log()
+    th.join()
+    assert [e.user_id for e in new_entries] == \
+        [r[1] for r in records[100:]]
+    assert len(z.att_log) == 120
+
+    # the log was cleared, the remaining entries are new
+    th = run_device(dev, [status_reply(5)] +
+                    device_replies(att_dataset(records[:5]), 1024))
+    assert len(z.read_new_att_log()) == 5
+    th.join()
+    dev.close()
+
+
+def test_cache():
+    users = make_users(10)
+    entries = b''.join(u.ser_user() for u in users)
+    dataset = struct.pack('<I', len(entries)) + entries
+
+    def status_reply(user_count):
+        status = bytearray(80)
+        struct.pack_into('<I', status, DEFS.STATUS['user_count'], user_count)
+        return pyzatt.ZKSS().create_packet(DEFS.CMD_ACK_OK, status)
+
+    z = pyzatt.ZKSS()
+    z.soc_zk, dev = socket.socketpair()
+    z.enable_cache()
+
+    # first read, the users are downloaded
+    th = run_device(dev, [status_reply(10)] + device_replies(dataset, 1024))
+    z.read_all_user_id()
+    th.join()
+    assert len(z.users) == 10
+
+    # the counters didn't change, the users are kept
+    z.users[1].user_name = "Local"
+    th = run_device(dev, [status_reply(10)])
+    z.read_all_user_id()
+    th.join()
+    assert z.users[1].user_name == "Local"
+
+    # local write, the users are downloaded again
+    th = run_ack_device(dev, 2)
+    z.upload_user_info(users[1].user_id)
+    th.join()
+    th = run_device(dev, [status_reply(10)] + device_replies(dataset, 1024))
+    z.read_all_user_id()
+    th.join()
+    assert z.users[1].user_name == users[0].user_name
+
+    # the counters changed
+    th = run_device(dev, [status_reply(11)] + device_replies(dataset, 1024))
+    z.users[1].user_name = "Local"
+    z.read_all_user_id()
+    th.join()
+    assert z.users[1].user_name == users[0].user_name
+
+    # the templates are cached, until the user holding them is replaced
+    z.update_cache('fptmps', z.cache_entries['users'][0])
+    z.store_user(z.users[2])
+    assert 'fptmps' in z.cache_entries
+    z.store_user(make_users(2)[1])
+    assert 'fptmps' not in z.cache_entries
+
+    # writes to user fields that keep the counters also drop the users
+    th = run_ack_device(dev, 2)
+    z.set_user_group(users[1].user_id, 2)
+    th.join()
+    assert 'users' not in z.cache_entries
+    dev.close()
+
+
+def test_read_att_log_columns():
+    t0 = datetime.datetime(2021, 3, 6, 23, 59, 0)
+    records = [(sn, str(sn), sn % 3, t0 + datetime.timedelta(seconds=sn),
+                sn % 2) for sn in range(100)]
+    entries = b''.join(att_record(*r) for r in records)
+    dataset = struct.pack('<I', len(entries)) + entries
+
+    for use_numpy in [False, True]:
+        z, dev, th = session_with(dataset, 333)
+        columns = z.read_att_log_columns(use_numpy=use_numpy)
+        th.join()
+        dev.close()
+
+        assert list(columns['user_sn']) == [r[0] for r in records]
+        assert [misc.decode_time_value(int(t))
+                for t in columns['att_time']] == [r[3] for r in records]
+        assert list(columns['ver_type']) == [r[2] for r in records]
+        assert list(columns['ver_state']) == [r[4] for r in records]
+        user_ids = [u if isinstance(u, str) else u.decode('ascii')
+                    for u in columns['user_id']]
+        assert user_ids == [r[1] for r in records]
+
+
+def test_read_att_log_columns_numpy():
+    np = pytest.importorskip('numpy')
+    t0 = datetime.datetime(2021, 12, 31, 23, 0, 0)
+    records = [(sn, str(sn * 11), sn % 3, t0 + datetime.timedelta(minutes=sn),
+                sn % 2) for sn in range(200)]
+    entries = b''.join(att_record(*r) for r in records)
+    dataset = struct.pack('<I', len(entries)) + entries
+
+    results = []
+    for use_numpy in [False, True]:
+        z, dev, th = session_with(dataset, 333)
+        results.append(z.read_att_log_columns(use_numpy=use_numpy))
+        th.join()
+        dev.close()
+    columns, np_columns = results
+
+    for name in ['user_sn', 'ver_type', 'att_time', 'ver_state']:
+        assert isinstance(np_columns[name], np.ndarray)
+        assert np_columns[name].tolist() == list(columns[name])
+    assert [u.decode('ascii') for u in np_columns['user_id']] == \
+        columns['user_id']
+
+
+def test_attendance_log():
+    t0 = datetime.datetime(2020, 5, 1, 7, 0, 0)
+    att_log = pyzatt.AttendanceLog()
+    for sn in range(10):
+        att_log.append_fields(sn, str(sn % 3), 1,
+                              misc.encode_time_value(t0 + datetime.timedelta(
+                                  hours=sn)), 0)
+
+    assert len(att_log) == 10
+    assert att_log[4].att_time == t0 + datetime.timedelta(hours=4)
+    assert att_log[-1].user_sn == 9
+    assert [e.user_sn for e in att_log[2:8:2]] == [2, 4, 6]
+    assert att_log.user_ids[0] is att_log.user_ids[3]
+
+    att_log += [pyzatt.ATTen(10, '77', 2, t0, 1)]
+    assert len(att_log) == 11
+    assert att_log[10].att_time == t0
+
+    # entries appended as with the list used before
+    att_log.append(pyzatt.ATTen(11, '78', 1, t0, 0))
+    assert len(att_log) == 12
+    assert att_log[11].user_id == '78'
+
+    z = pyzatt.ZKSS()
+    z.append_att_entry(1, '1', 1, t0, 0)
+    assert z.att_log[0].att_time == t0
+    assert z.att_log[0].user_id == '1'
+
+    z = pyzatt.ZKSS()
+    z.att_log = att_log
+    z.print_attlog()
+
+
+def test_user_entry():
+    user = make_users(1)[0]
+    user_entry = bytes(user.ser_user())
+
+    zuser = pyzatt.ZKUser(user_entry)
+    assert not zuser.is_decoded('user_name')
+    assert zuser.user_id == user.user_id
+    assert not zuser.is_decoded('user_name')
+    assert zuser.ser_user() == user_entry
+
+    # change a field, the rest of the entry is kept
+    zuser.user_password = '1234'
+    user.user_password = '1234'
+    assert zuser.ser_user() == user.ser_user()
+    assert pyzatt.ZKUser(bytes(zuser.ser_user())).user_password == '1234'
+
+    assert zuser.user_fptmps == [[0, 0]] * 10
+    zuser.set_user_fptmp(3, b'tmp', 1)
+    assert zuser.user_fptmps[3] == [b'tmp', 1]
+
+    # the templates may be changed through the list view
+    zuser.user_fptmps[5] = [b'tmp5', 3]
+    assert zuser.fptmps[5] == [b'tmp5', 3]
+    zuser.user_fptmps[3] = [0, 0]
+    assert list(zuser.fptmps) == [5]
+    assert zuser.user_fptmps[-5] == [b'tmp5', 3]
+
+
+def test_create_user():
+    z = pyzatt.ZKSS()
+    assert [z.create_user() for _ in range(5)] == [1, 2, 3, 4, 5]
+
+    # released indexes are reused, the lowest first
+    z.sn_allocator.release(4)
+    z.sn_allocator.release(2)
+    assert z.create_user() == 2
+    assert z.create_user() == 4
+    assert z.create_user() == 6
+
+    # indexes read from the device
+    z.sn_allocator.reset([1, 3, 7])
+    assert [z.create_user() for _ in range(3)] == [2, 4, 5]
+    z.add_user(10)
+    assert [z.create_user() for _ in range(3)] == [6, 8, 9]
+    assert z.create_user() == 11
+
+    # capacity of the device
+    z.sn_allocator.capacity = z.sn_allocator.count() + 1
+    assert z.create_user() == 12
+    assert z.create_user() == -1
+
+
+def test_upload_users():
+    users = make_users(40)
+    for user in users[20:]:
+        user.user_sn = None
+
+    # the device rejects one user
+    def reply(dev_z):
+        code = DEFS.CMD_ACK_OK
+        if dev_z.last_reply_code == DEFS.CMD_USER_WRQ and \
+                dev_z.last_payload_data[48:52] == b'1005':
+            code = DEFS.CMD_ACK_ERROR
+        return dev_z.create_packet(code,
+                                   reply_number=dev_z.last_reply_counter)
+
+    z = pyzatt.ZKSS()
+    z.soc_zk, dev = socket.socketpair()
+    th = run_ack_device(dev, len(users) + 1, reply)
+    results = z.upload_users(users, window=8)
+    th.join()
+    dev.close()
+
+    assert len(results) == len(users)
+    assert [u.user_id for u, ok in zip(users, results) if not ok] == ['1005']
+    assert sorted(z.users) == list(range(1, 41))
+    assert z.id_to_sn('1040') == 40
+
+
+def test_upload_users_replies():
+    users = make_users(12)
+    users[7].user_id = users[2].user_id
+
+    # the device doesn't reply to the fifth user, and sends an extra
+    # reply after the tenth user
+    def reply(dev_z):
+        if dev_z.last_reply_code != DEFS.CMD_USER_WRQ:
+            return dev_z.create_packet(DEFS.CMD_ACK_OK,
+                                       reply_number=dev_z.last_reply_counter)
+        sn = struct.unpack('<H', dev_z.last_payload_data[0:2])[0]
+        code = DEFS.CMD_ACK_ERROR if sn == 8 else DEFS.CMD_ACK_OK
+        if sn == 5:
+            return b''
+        zkp = dev_z.create_packet(code, reply_number=dev_z.last_reply_counter)
+        if sn == 10:
+            zkp += dev_z.create_packet(DEFS.CMD_ACK_OK, reply_number=9999)
+        return zkp
+
+    z = pyzatt.ZKSS()
+    z.soc_zk, dev = socket.socketpair()
+    th = run_ack_device(dev, len(users) + 1, reply)
+    results = z.upload_users(users, window=4)
+    th.join()
+    dev.close()
+
+    # the results of the users with the same ID are kept apart
+    assert results == [sn not in (5, 8) for sn in range(1, 13)]
+
+
+def buffer_reply(dev_z, buffer):
+    # acknowledges a command, giving the checksum of the buffer if requested
+    data = bytearray()
+    if dev_z.last_reply_code == DEFS.CMD_CHECKSUM_BUFFER:
+        data = bytearray(struct.pack('<I', misc.buffer_checksum(buffer)))
+    return dev_z.create_packet(DEFS.CMD_ACK_OK, data,
+                               reply_number=dev_z.last_reply_counter)
+
+
+def test_upload_all_users():
+    users = make_users(100)
+    received = bytearray()
+    codes = []
+
+    def reply(dev_z):
+        codes.append(dev_z.last_reply_code)
+        if dev_z.last_reply_code == DEFS.CMD_DATA:
+            received.extend(dev_z.last_payload_data)
+        return buffer_reply(dev_z, received)
+
+    z = pyzatt.ZKSS()
+    z.soc_zk, dev = socket.socketpair()
+    chunks = (12 + 72 * len(users) + 1023) // 1024
+    th = run_ack_device(dev, chunks + 5, reply)
+    assert z.upload_all_users(users)
+    th.join()
+    dev.close()
+
+    assert codes == [DEFS.CMD_PREPARE_DATA] + [DEFS.CMD_DATA] * chunks + \
+        [DEFS.CMD_CHECKSUM_BUFFER, DEFS.CMD_SAVE_USERTEMPS,
+         DEFS.CMD_FREE_DATA, DEFS.CMD_REFRESHDATA]
+    assert received[0:12] == struct.pack('<III', 72 * len(users), 0, 0)
+    assert received[12:] == b''.join(u.ser_user() for u in users)
+    assert len(z.users) == len(users)
+
+
+def test_upload_fps():
+    users = make_users(3)
+    fps = [(u.user_id, bytearray([i] * (500 + i)), i % 10, 1)
+           for i, u in enumerate(users)]
+    # the write request of the second template is rejected once
+    buffer = bytearray()
+    rejected = []
+    written = []
+
+    def reply(dev_z):
+        code = dev_z.last_reply_code
+        if code == DEFS.CMD_PREPARE_DATA:
+            buffer.clear()
+        elif code == DEFS.CMD_DATA:
+            buffer.extend(dev_z.last_payload_data)
+        elif code == DEFS.CMD_TMP_WRITE:
+            if buffer[0] == 1 and not rejected:
+                rejected.append(True)
+                return dev_z.create_packet(
+                    DEFS.CMD_ACK_ERROR, reply_number=dev_z.last_reply_counter)
+            written.append(bytes(dev_z.last_payload_data))
+        return buffer_reply(dev_z, buffer)
+
+    z = pyzatt.ZKSS()
+    for user in users:
+        z.store_user(user)
+    z.soc_zk, dev = socket.socketpair()
+    # disable, 5 commands per template, 5 for the retry and refresh,
+    # nothing is sent for the unknown user
+    th = run_ack_device(dev, 1 + 5 * 3 + 5 + 1, reply)
+    results = z.upload_fps(fps[:1] + [('nobody', b'tmp', 2, 1)] + fps[1:])
+    th.join()
+    dev.close()
+
+    assert rejected
+    assert results.pop(('nobody', 2)) is False
+    assert results == {(uid, idx): True for uid, _, idx, _ in fps}
+    assert sorted(written) == sorted(
+        z.tmp_write_data(z.id_to_sn(uid), fp, idx, flg)
+        for uid, fp, idx, flg in fps)
+
+
+def test_upload_fp_checksum():
+    users = make_users(1)
+    fp = bytearray([1, 2, 3, 4] * 100)
+    codes = []
+
+    # the device gives a fixed checksum, 1000 is the sum of the bytes
+    def run_fixed_device(dev, count, checksum):
+        def reply(dev_z):
+            codes.append(dev_z.last_reply_code)
+            data = bytearray()
+            if dev_z.last_reply_code == DEFS.CMD_CHECKSUM_BUFFER:
+                data = bytearray(checksum)
+            return dev_z.create_packet(DEFS.CMD_ACK_OK, data,
+                                       reply_number=dev_z.last_reply_counter)
+        return run_ack_device(dev, count, reply)
+
+    z = pyzatt.ZKSS()
+    z.store_user(users[0])
+    z.soc_zk, dev = socket.socketpair()
+
+    th = run_fixed_device(dev, 7, b'\xe8\x03\x00\x00')
+    assert z.upload_fp(users[0].user_id, fp, 0, 1)
+    th.join()
+    assert DEFS.CMD_TMP_WRITE in codes
+
+    # the checksum doesn't match, it's only reported, the template is
+    # written as before
+    codes.clear()
+    th = run_fixed_device(dev, 7, b'\xef\xbe\xad\xde')
+    assert z.upload_fp(users[0].user_id, fp, 0, 1)
+    th.join()
+    assert DEFS.CMD_TMP_WRITE in codes
+
+    # the users are also saved
+    codes.clear()
+    th = run_fixed_device(dev, 6, b'\xef\xbe\xad\xde')
+    assert z.upload_all_users(users)
+    th.join()
+    assert DEFS.CMD_SAVE_USERTEMPS in codes
+
+    assert not z.upload_fp('nobody', fp, 0, 1)
+    dev.close()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+import asyncio
+import datetime
+import socket
+import struct
+import threading
+import time
+import pyzatt.pyzatt as pyzatt
+import pyzatt.zkmodules.defs as DEFS
+from pyzatt.aiozatt import AsyncZKSS
+from pyzatt.zkmodules.realtime import decode_event, AttLogEvent, \
+    AlarmEvent, EnrollFingerEvent, FingerScoreEvent, VerifyEvent, \
+    RawEvent, EventBuffer
+from tests.test_packet import recv_command
+
+"""
+Test script to check the decoding of realtime events, these tests don't
+require a device.
+"""
+
+
+def test_decode_event():
+    payload = b'1234'.ljust(24, b'\x00') + struct.pack('<H', 1) + \
+        bytes([21, 3, 6, 8, 30, 15])
+    assert decode_event(DEFS.EF_ATTLOG, payload) == AttLogEvent(
+        '1234', 1, datetime.datetime(2021, 3, 6, 8, 30, 15))
+
+    assert decode_event(DEFS.EF_ALARM, struct.pack('<I', 0x3a)) == \
+        AlarmEvent(0x3a, None, None, None)
+    assert decode_event(DEFS.EF_ALARM, struct.pack('<IHHI', 0, 1, 5, 2)) == \
+        AlarmEvent(0, 1, 5, 2)
+
+    payload = struct.pack('<HH', 0, 512) + b'77'.ljust(9, b'\x00') + b'\x03'
+    event = decode_event(DEFS.EF_ENROLLFINGER, payload)
+    assert event == EnrollFingerEvent(True, '77', 3, 512)
+    assert event.code == DEFS.EF_ENROLLFINGER
+
+    assert decode_event(DEFS.EF_FPFTR, b'\x64') == FingerScoreEvent(100)
+    assert decode_event(DEFS.EF_VERIFY, struct.pack('<IB', 9, 1)) == \
+        VerifyEvent(9, 1)
+
+    # events without decoder, or with invalid payloads
+    assert decode_event(DEFS.EF_FINGER, b'') == RawEvent(DEFS.EF_FINGER, b'')
+    assert decode_event(DEFS.EF_VERIFY, b'\x01') == \
+        RawEvent(DEFS.EF_VERIFY, b'\x01')
+
+
+def test_recv_event():
+    z = pyzatt.ZKSS()
+    z.soc_zk, dev = socket.socketpair()
+    dev_z = pyzatt.ZKSS()
+    dev_z.session_id = DEFS.EF_FPFTR
+    dev.sendall(dev_z.create_packet(DEFS.CMD_REG_EVENT, bytearray(b'\x64')))
+
+    event = z.recv_event()
+    assert event == FingerScoreEvent(100)
+    assert z.last_event is event
+    assert z.last_event_code == DEFS.EF_FPFTR
+    assert z.parse_score_fp_event() == 100
+
+    z.soc_zk.close()
+    dev.close()
+
+
+def test_event_buffer():
+    events = [RawEvent(code, bytes([i])) for i, code in
+              enumerate([DEFS.EF_FINGER, DEFS.EF_BUTTON, DEFS.EF_FINGER])]
+
+    buffer = EventBuffer(2, 'block')
+    assert buffer.push(events[0]) and buffer.push(events[1])
+    assert not buffer.push(events[2])
+    assert list(buffer.events) == events[:2]
+
+    buffer = EventBuffer(2, 'drop_oldest')
+    for event in events:
+        assert buffer.push(event)
+    assert list(buffer.events) == events[1:]
+
+    buffer = EventBuffer(2, 'coalesce')
+    for event in events:
+        assert buffer.push(event)
+    assert list(buffer.events) == [events[2], events[1]]
+    assert buffer.pop() == events[2]
+
+
+def run_event_device(dev, events):
+    # acknowledges the enable command, then sends the events, waiting for
+    # the acknowledge of each one
+    def serve():
+        dev_z = pyzatt.ZKSS()
+        dev_z.parse_ans(recv_command(dev))
+        dev.sendall(dev_z.create_packet(DEFS.CMD_ACK_OK))
+        for event_code, data in events:
+            dev_z.session_id = event_code
+            dev.sendall(dev_z.create_packet(DEFS.CMD_REG_EVENT,
+                                            bytearray(data), reply_number=0))
+            recv_command(dev)
+    th = threading.Thread(target=serve)
+    th.start()
+    return th
+
+
+def test_events():
+    z = pyzatt.ZKSS()
+    z.soc_zk, dev = socket.socketpair()
+    th = run_event_device(dev, [(DEFS.EF_FPFTR, b'\x64'),
+                                (DEFS.EF_BUTTON, b''),
+                                (DEFS.EF_VERIFY, struct.pack('<IB', 9, 1))])
+
+    events = z.events(ef_mask=DEFS.EF_FPFTR | DEFS.EF_VERIFY,
+                      poll_interval=0.05)
+    assert next(events) == FingerScoreEvent(100)
+    # the button event is filtered
+    assert next(events) == VerifyEvent(9, 1)
+    events.close()
+    th.join()
+
+    z.soc_zk.close()
+    dev.close()
+
+
+def test_events_close():
+    z = pyzatt.ZKSS()
+    z.soc_zk, dev = socket.socketpair()
+    th = run_event_device(dev, [(DEFS.EF_FPFTR, b'\x64')])
+
+    events = z.events(poll_interval=0.05)
+    assert next(events) == FingerScoreEvent(100)
+    th.join()
+
+    # the device sends part of a packet, then stays silent
+    dev_z = pyzatt.ZKSS()
+    dev_z.session_id = DEFS.EF_FPFTR
+    dev.sendall(dev_z.create_packet(DEFS.CMD_REG_EVENT, bytearray(b'\x50'),
+                                    reply_number=0)[:12])
+    time.sleep(0.1)
+    t0 = time.monotonic()
+    events.close()
+    assert time.monotonic() - t0 < 1
+    assert z.soc_zk.gettimeout() is None
+
+    z.soc_zk.close()
+    dev.close()
+
+
+def test_async_events():
+    sock, dev = socket.socketpair()
+    th = run_event_device(dev, [(DEFS.EF_FPFTR, b'\x64'),
+                                (DEFS.EF_BUTTON, b'')])
+
+    async def consume():
+        z = AsyncZKSS()
+        z.reader, z.writer = await asyncio.open_connection(sock=sock)
+        received = []
+        async for event in z.events(overflow='drop_oldest'):
+            received.append(event)
+            if len(received) == 2:
+                break
+        z.writer.close()
+        return received
+
+    loop = asyncio.new_event_loop()
+    received = loop.run_until_complete(consume())
+    loop.close()
+    th.join()
+    dev.close()
+
+    assert received == [FingerScoreEvent(100), RawEvent(DEFS.EF_BUTTON, b'')]
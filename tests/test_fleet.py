@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+import asyncio
+import datetime
+import socket
+import struct
+from pyzatt.fleet import ZKFleet, AsyncZKFleet
+from tests.test_packet import device_replies, run_device
+from tests.test_datasets import att_record
+
+"""
+Test script to check the fleet managers, the replies of the devices are
+simulated, so these tests don't require a device.
+"""
+
+
+def att_dataset(count):
+    t0 = datetime.datetime(2020, 3, 6, 8, 30, 15)
+    entries = b''.join(
+        att_record(1, '1', 1, t0 + datetime.timedelta(minutes=i), 0)
+        for i in range(count))
+    return struct.pack('<I', len(entries)) + entries
+
+
+def test_fleet():
+    devices = [('10.0.0.%i' % i, 4370) for i in range(6)]
+    fleet = ZKFleet(devices, max_workers=3)
+
+    threads = []
+    socks = []
+    for i, zk in enumerate(fleet.sessions.values()):
+        zk.soc_zk, dev = socket.socketpair()
+        socks.append(dev)
+        if i == 2:
+            dev.close()  # unreachable device
+        else:
+            threads.append(run_device(dev, device_replies(
+                att_dataset(10 * i), 1024)))
+
+    results = fleet.read_att_log()
+    for th in threads:
+        th.join()
+
+    assert list(results) == devices
+    for i, device in enumerate(devices):
+        if i == 2:
+            assert results[device].error is not None
+        else:
+            assert results[device].error is None
+            assert len(results[device].value) == 10 * i
+
+    for zk in fleet.sessions.values():
+        zk.soc_zk.close()
+    for dev in socks:
+        dev.close()
+
+
+def test_async_fleet():
+    devices = [('10.0.0.%i' % i, 4370) for i in range(5)]
+    fleet = AsyncZKFleet(devices, limit=2)
+    socks = [socket.socketpair() for _ in devices]
+    threads = [run_device(dev, device_replies(att_dataset(5 * i), 1024))
+               for i, (_, dev) in enumerate(socks)]
+
+    async def read():
+        for zk, (sock, _) in zip(fleet.sessions.values(), socks):
+            zk.reader, zk.writer = await asyncio.open_connection(sock=sock)
+        results = await fleet.read_att_log()
+        for zk in fleet.sessions.values():
+            zk.writer.close()
+        return results
+
+    loop = asyncio.new_event_loop()
+    results = loop.run_until_complete(read())
+    loop.close()
+    for th in threads:
+        th.join()
+
+    for i, device in enumerate(devices):
+        assert results[device].error is None
+        assert len(results[device].value) == 5 * i
+
+    for _, dev in socks:
+        dev.close()
+
+
+def test_fleet_timeout():
+    devices = [('10.0.0.%i' % i, 4370) for i in range(3)]
+    fleet = ZKFleet(devices, timeout=0.2)
+
+    threads = []
+    socks = []
+    for i, zk in enumerate(fleet.sessions.values()):
+        zk.soc_zk, dev = socket.socketpair()
+        socks.append(dev)
+        # the second device accepts the connection but never replies
+        if i != 1:
+            threads.append(run_device(dev, device_replies(
+                att_dataset(3), 1024)))
+
+    results = fleet.read_att_log()
+    for th in threads:
+        th.join()
+
+    assert isinstance(results[devices[1]].error, socket.timeout)
+    assert len(results[devices[0]].value) == 3
+    assert len(results[devices[2]].value) == 3
+
+    for zk in fleet.sessions.values():
+        zk.soc_zk.close()
+    for dev in socks:
+        dev.close()
+
+
+def test_async_fleet_timeout():
+    devices = [('10.0.0.%i' % i, 4370) for i in range(3)]
+    fleet = AsyncZKFleet(devices, timeout=0.2)
+    socks = [socket.socketpair() for _ in devices]
+    threads = [run_device(dev, device_replies(att_dataset(3), 1024))
+               for i, (_, dev) in enumerate(socks) if i != 1]
+
+    async def read():
+        for zk, (sock, _) in zip(fleet.sessions.values(), socks):
+            zk.reader, zk.writer = await asyncio.open_connection(sock=sock)
+        results = await fleet.read_att_log()
+        for zk in fleet.sessions.values():
+            zk.writer.close()
+        return results
+
+    loop = asyncio.new_event_loop()
+    results = loop.run_until_complete(read())
+    loop.close()
+    for th in threads:
+        th.join()
+
+    assert isinstance(results[devices[1]].error, asyncio.TimeoutError)
+    assert len(results[devices[0]].value) == 3
+    assert len(results[devices[2]].value) == 3
+
+    for _, dev in socks:
+        dev.close()
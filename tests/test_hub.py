@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+import queue
+import socket
+import time
+import pyzatt.pyzatt as pyzatt
+import pyzatt.zkmodules.defs as DEFS
+from pyzatt.hub import ZKEventHub
+
+"""
+Test script to check the realtime event hub, the events of the devices are
+simulated, so these tests don't require a device.
+"""
+
+
+def event_packet(event_code, data):
+    dev_z = pyzatt.ZKSS()
+    dev_z.session_id = event_code
+    return dev_z.create_packet(DEFS.CMD_REG_EVENT, bytearray(data),
+                               reply_number=0)
+
+
+def test_hub():
+    events = queue.Queue()
+    hub = ZKEventHub(events)
+    codes = []
+    hub.add_callback(lambda ev: codes.append(ev.session.last_event_code))
+
+    sessions = [pyzatt.ZKSS() for _ in range(4)]
+    devs = []
+    for zk in sessions:
+        zk.soc_zk, dev = socket.socketpair()
+        devs.append(dev)
+        hub.register(zk)
+
+    # only the third device sends an event
+    devs[2].sendall(event_packet(DEFS.EF_FINGER, b'\x01\x02'))
+    assert hub.poll(1) == 1
+    ev = events.get_nowait()
+    assert ev.session is sessions[2]
+    assert ev.code == DEFS.EF_FINGER
+    assert ev.data == b'\x01\x02'
+    assert codes == [DEFS.EF_FINGER]
+
+    # the event was acknowledged
+    ack = pyzatt.ZKSS()
+    assert ack.parse_ans(bytearray(devs[2].recv(4096)))
+    assert ack.recvd_ack()
+
+    # no events
+    assert hub.poll(0) == 0
+
+    # a device closes the connection, its session is removed
+    devs[0].close()
+    devs[1].sendall(event_packet(DEFS.EF_ALARM, b'\x00' * 4))
+    total = 0
+    while total < 1 or len(hub.sessions()) == 4:
+        total += hub.poll(1)
+    assert len(hub.sessions()) == 3
+    assert events.get_nowait().code == DEFS.EF_ALARM
+
+    hub.close()
+    for zk in sessions:
+        zk.soc_zk.close()
+    for dev in devs[1:]:
+        dev.close()
+
+
+def test_hub_partial_packet():
+    events = queue.Queue()
+    hub = ZKEventHub(events)
+
+    # a failing callback doesn't stop the hub
+    def callback(ev):
+        raise ValueError("callback error")
+    hub.add_callback(callback)
+
+    sessions = [pyzatt.ZKSS() for _ in range(2)]
+    devs = []
+    for zk in sessions:
+        zk.soc_zk, dev = socket.socketpair()
+        devs.append(dev)
+        hub.register(zk)
+    assert all(zk.soc_zk.gettimeout() == 0 for zk in sessions)
+
+    # the first device sends half a packet, the second one a whole event
+    pkt = event_packet(DEFS.EF_FINGER, b'\x01\x02\x03\x04')
+    devs[0].sendall(pkt[:10])
+    devs[1].sendall(event_packet(DEFS.EF_ALARM, b'\x00' * 4))
+
+    t0 = time.monotonic()
+    total = 0
+    while total < 1:
+        total += hub.poll(1)
+    assert time.monotonic() - t0 < 1
+    ev = events.get_nowait()
+    assert ev.session is sessions[1]
+    assert ev.code == DEFS.EF_ALARM
+
+    # the rest of the packet arrives
+    devs[0].sendall(pkt[10:])
+    while total < 2:
+        total += hub.poll(1)
+    ev = events.get_nowait()
+    assert ev.session is sessions[0]
+    assert ev.data == b'\x01\x02\x03\x04'
+    assert len(hub.sessions()) == 2
+
+    # the sockets are blocking again when the sessions are removed
+    for zk in sessions:
+        hub.unregister(zk)
+        assert zk.soc_zk.gettimeout() is None
+
+    hub.close()
+    for zk in sessions:
+        zk.soc_zk.close()
+    for dev in devs:
+        dev.close()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+import datetime
+import random
+import pytest
+import pyzatt.misc as misc
+
+"""
+Test script to check the encoding/decoding helpers, these tests don't
+require a device.
+"""
+
+
+def ref_checksum16(payload):
+    # straightforward implementation of the packet checksum
+    payload = bytearray(payload)
+    if len(payload) % 2 == 1:
+        payload.append(0x00)
+    chk_32b = 0
+    for j in range(0, len(payload), 2):
+        chk_32b += payload[j] + (payload[j + 1] << 8)
+    chk_32b = (chk_32b & 0xFFFF) + ((chk_32b & 0xFFFF0000) >> 16)
+    return chk_32b ^ 0xFFFF
+
+
+def test_checksum16():
+    rnd = random.Random(1)
+    for size in [0, 1, 2, 3, 15, 16, 1023, 4096, 70001]:
+        payload = bytearray(rnd.getrandbits(8) for _ in range(size))
+        assert misc.checksum16(bytearray(payload)) == ref_checksum16(payload)
+
+    # large payload of 0xff, the accumulator overflows 32 bits
+    payload = bytearray([0xff] * 300000)
+    assert misc.checksum16(bytearray(payload)) == ref_checksum16(payload)
+
+
+def test_checksum16_incremental():
+    rnd = random.Random(2)
+    payload = bytearray(rnd.getrandbits(8) for _ in range(5001))
+    for chunk_size in [1, 2, 3, 7, 64, 1000]:
+        chk = misc.Checksum16()
+        for i in range(0, len(payload), chunk_size):
+            chk.update(payload[i:i + chunk_size])
+        assert chk.digest() == ref_checksum16(payload)
+
+
+def test_valid_payload():
+    payload = bytearray(bytes(range(40)))
+    payload[2:4] = b'\x00\x00'
+    payload[2:4] = misc.checksum16(bytearray(payload)).to_bytes(2, 'little')
+    assert misc.is_valid_payload(bytearray(payload))
+    payload[5] ^= 0x01
+    assert not misc.is_valid_payload(bytearray(payload))
+
+
+def test_checksum16_no_mutation():
+    payload = bytearray(range(11))
+    chk = misc.checksum16(payload)
+    assert payload == bytearray(range(11))
+    assert misc.checksum16(memoryview(payload)) == chk
+    assert misc.checksum16(bytes(payload)) == chk
+
+
+def test_decode_time():
+    times = [datetime.datetime(2000, 1, 1, 0, 0, 0),
+             datetime.datetime(2021, 12, 31, 23, 59, 59),
+             datetime.datetime(2020, 2, 29, 12, 30, 5),
+             datetime.datetime(2099, 7, 15, 6, 1, 2)]
+    for t in times:
+        assert misc.decode_time_value(misc.encode_time_value(t)) == t
+        assert misc.decode_time(misc.encode_time(t)) == t
+
+
+def test_decode_times():
+    rnd = random.Random(3)
+    t0 = datetime.datetime(2001, 1, 1)
+    times = [t0 + datetime.timedelta(seconds=rnd.randrange(10 ** 9))
+             for _ in range(500)]
+    enc_times = [misc.encode_time_value(t) for t in times]
+    epochs = [int((t - misc.EPOCH).total_seconds()) for t in times]
+
+    for use_numpy in [False, True]:
+        assert list(misc.decode_times(enc_times, use_numpy)) == epochs
+        assert list(misc.encode_times(epochs, use_numpy)) == enc_times
+
+
+def test_decode_times_numpy():
+    np = pytest.importorskip('numpy')
+    rnd = random.Random(5)
+    t0 = datetime.datetime(2000, 1, 1)
+    times = [t0 + datetime.timedelta(seconds=rnd.randrange(3 * 10 ** 9))
+             for _ in range(500)]
+    # last second of the years and leap days
+    times += [datetime.datetime(y, 12, 31, 23, 59, 59) for y in (2000, 2021)]
+    times += [datetime.datetime(2020, 2, 29, 0, 0, 0)]
+    enc_times = [misc.encode_time_value(t) for t in times]
+
+    epochs = misc.decode_times(enc_times, use_numpy=False)
+    np_epochs = misc.decode_times(enc_times)
+    assert isinstance(np_epochs, np.ndarray)
+    assert np_epochs.tolist() == list(epochs)
+
+    times64 = misc.decode_times64(enc_times)
+    assert times64.dtype == np.dtype('datetime64[s]')
+    assert times64.tolist() == times
+
+    assert misc.encode_times(np_epochs).tolist() == \
+        list(misc.encode_times(epochs, use_numpy=False))
+    assert misc.encode_times(times64).tolist() == enc_times
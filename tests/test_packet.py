@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+
+import socket
+import struct
+import threading
+import pyzatt.pyzatt as pyzatt
+import pyzatt.zkmodules.defs as DEFS
+from pyzatt.zkmodules.packet import Packet
+
+"""
+Test script to check creation and parsing of packets, these tests don't
+require a device.
+"""
+
+
+def test_packet_view():
+    z = pyzatt.ZKSS()
+    z.session_id = 0x1234
+    z.reply_number = 7
+    zkp = z.create_packet(DEFS.CMD_ACK_OK, bytearray(b'payload'))
+
+    pkt = Packet(zkp)
+    assert pkt.has_valid_tag()
+    assert pkt.has_valid_checksum()
+    assert pkt.size == len(zkp) - 8
+    assert pkt.code == DEFS.CMD_ACK_OK
+    assert pkt.session_code == 0x1234
+    assert pkt.reply_counter == 7
+    assert isinstance(pkt.payload, memoryview)
+    assert pkt.payload == b'payload'
+
+
+def test_parse_ans():
+    z = pyzatt.ZKSS()
+    zkp = z.create_packet(DEFS.CMD_DATA, bytearray(range(33)))
+    assert z.parse_ans(zkp)
+    assert z.last_reply_code == DEFS.CMD_DATA
+    assert z.last_payload_data == bytearray(range(33))
+    assert isinstance(z.last_payload_data, bytes)
+
+    # corrupt the payload
+    zkp[20] ^= 0xff
+    assert not z.parse_ans(zkp)
+    assert z.last_reply_code == -1
+
+    # corrupt the start tag
+    zkp = z.create_packet(DEFS.CMD_DATA)
+    zkp[0] = 0
+    assert not z.parse_ans(zkp)
+
+    assert not z.parse_ans(bytearray(8))
+
+
+def test_send_command():
+    z = pyzatt.ZKSS()
+    z.soc_zk, dev = socket.socketpair()
+    z.send_buffer = bytearray(20)
+
+    data = bytearray(range(200))
+    z.send_command(DEFS.CMD_DATA, data)
+    zkp = bytearray(dev.recv(4096))
+    assert zkp == z.create_packet(DEFS.CMD_DATA, data)
+
+    z.send_command(DEFS.CMD_CONNECT)
+    zkp = bytearray(dev.recv(4096))
+    assert zkp == z.create_packet(DEFS.CMD_CONNECT)
+
+    z.soc_zk.close()
+    dev.close()
+
+
+def device_replies(dataset, chunk_size):
+    # replies sent by a device when a large dataset is requested, each
+    # item is sent after receiving a command
+    dev_z = pyzatt.ZKSS()
+    replies = [dev_z.create_packet(DEFS.CMD_ACK_OK, bytearray(
+        b'\x00' + struct.pack('<I', len(dataset)) + bytes(4)))]
+
+    pkts = dev_z.create_packet(DEFS.CMD_PREPARE_DATA,
+                               bytearray(struct.pack('<II', len(dataset), 0)))
+    for i in range(0, len(dataset), chunk_size):
+        pkts += dev_z.create_packet(DEFS.CMD_DATA, dataset[i:i + chunk_size])
+    pkts += dev_z.create_packet(DEFS.CMD_ACK_OK)
+    replies += [pkts, dev_z.create_packet(DEFS.CMD_ACK_OK)]
+    return replies
+
+
+def run_device(dev, replies):
+    # sends each reply after a command is received
+    def serve():
+        for reply in replies:
+            dev.recv(4096)
+            dev.sendall(reply)
+    th = threading.Thread(target=serve)
+    th.start()
+    return th
+
+
+def recv_command(dev):
+    # receives exactly one packet sent to the device
+    zkp = bytearray()
+    while len(zkp) < 8 or len(zkp) < 8 + struct.unpack('<H', zkp[4:6])[0]:
+        size = 8 if len(zkp) < 8 else \
+            8 + struct.unpack('<H', zkp[4:6])[0] - len(zkp)
+        zkp += dev.recv(size)
+    return zkp
+
+
+def run_ack_device(dev, count, reply=None):
+    # replies to a number of commands, the reply function may be given to
+    # build the reply for each received command
+    dev_z = pyzatt.ZKSS()
+
+    def serve():
+        for _ in range(count):
+            dev_z.parse_ans(recv_command(dev))
+            if reply is None:
+                dev.sendall(dev_z.create_packet(
+                    DEFS.CMD_ACK_OK, reply_number=dev_z.last_reply_counter))
+            else:
+                dev.sendall(reply(dev_z))
+    th = threading.Thread(target=serve)
+    th.start()
+    return th
+
+
+def test_recv_long_reply():
+    z = pyzatt.ZKSS()
+    z.soc_zk, dev = socket.socketpair()
+
+    dataset = bytearray(i % 251 for i in range(20001))
+    th = run_device(dev, device_replies(dataset, 1024))
+    z.send_command(DEFS.CMD_DATA_WRRQ)
+    assert z.recv_long_reply() == dataset
+    assert z.recvd_ack()
+    th.join()
+
+    # short dataset, sent in the reply
+    th = run_device(dev, [z.create_packet(DEFS.CMD_DATA, dataset[:100])])
+    z.send_command(DEFS.CMD_DATA_WRRQ)
+    assert z.recv_long_reply() == dataset[:100]
+    th.join()
+
+    z.soc_zk.close()
+    dev.close()
+
+
+def test_recv_data_chunk_size():
+    z = pyzatt.ZKSS()
+    z.soc_zk, dev = socket.socketpair()
+    z.soc_zk.settimeout(5)
+
+    # only the lower 16 bits of the size field give the packet size
+    ack = z.create_packet(DEFS.CMD_ACK_OK, bytearray(b'ack'))
+    data = z.create_packet(DEFS.CMD_DATA, bytearray(range(100)))
+    for zkp in [ack, data]:
+        zkp[6:8] = b'\xff\xff'
+
+    # a bad start tag, with a huge size, the rest of it isn't received
+    bad = z.create_packet(DEFS.CMD_DATA)
+    bad[0:8] = struct.pack('<4sI', b'\x00' * 4, 0xffffffff)
+
+    dev.sendall(bad + ack + data)
+    dataset = bytearray()
+    assert z.recv_data_chunk(dataset) == -1
+    assert z.last_reply_code == -1
+    assert z.recv_data_chunk(dataset) == -1
+    assert z.last_payload_data == b'ack'
+    assert z.recv_data_chunk(dataset) == 100
+    assert dataset == bytearray(range(100))
+
+    z.soc_zk.close()
+    dev.close()
+
+
+def test_recv_burst():
+    z = pyzatt.ZKSS()
+    z.soc_zk, dev = socket.socketpair()
+    dev_z = pyzatt.ZKSS()
+
+    # a reply followed by two events, in a single segment
+    burst = dev_z.create_packet(DEFS.CMD_ACK_OK, bytearray(b'reply'))
+    for event_code in [DEFS.EF_FINGER, DEFS.EF_BUTTON]:
+        dev_z.session_id = event_code
+        burst += dev_z.create_packet(DEFS.CMD_REG_EVENT, bytearray(b'ev'),
+                                     reply_number=0)
+    dev.sendall(burst)
+
+    z.recv_reply()
+    assert z.recvd_ack()
+    assert z.last_payload_data == b'reply'
+    assert z.recv_buffer.has_packet()
+
+    events = z.recv_events()
+    assert [ev.code for ev in events] == [DEFS.EF_FINGER, DEFS.EF_BUTTON]
+    assert len(z.recv_buffer) == 0
+
+    # both events were acknowledged
+    for _ in events:
+        assert dev_z.parse_ans(recv_command(dev))
+        assert dev_z.recvd_ack()
+
+    # a packet larger than the receive buffer, split in several segments
+    data = bytearray(range(256)) * 40
+    zkp = dev_z.create_packet(DEFS.CMD_DATA, data)
+    th = threading.Thread(target=lambda: [
+        dev.sendall(zkp[i:i + 1000]) for i in range(0, len(zkp), 1000)])
+    th.start()
+    assert z.recv_exact_reply()
+    assert z.last_payload_data == data
+    th.join()
+
+    z.soc_zk.close()
+    dev.close()
+
+
+def test_iter_long_reply_closed():
+    z = pyzatt.ZKSS()
+    z.soc_zk, dev = socket.socketpair()
+
+    dataset = bytearray(i % 251 for i in range(20001))
+    th = run_device(dev, device_replies(dataset, 1024) +
+                    [z.create_packet(DEFS.CMD_ACK_OK, bytearray(b'next'))])
+    z.send_command(DEFS.CMD_DATA_WRRQ)
+    chunks = z.iter_long_reply()
+    kept = [next(chunks), next(chunks)]
+    view = memoryview(kept[1])
+    chunks.close()
+
+    # the chunks kept by the consumer aren't modified by the drop of the
+    # remaining packets
+    assert kept == [dataset[:1024], dataset[1024:2048]]
+    view.release()
+
+    # the dataset was freed and the next reply is received as usual
+    z.send_command(DEFS.CMD_GET_TIME)
+    z.recv_reply()
+    assert z.last_payload_data == b'next'
+    th.join()
+
+    z.soc_zk.close()
+    dev.close()
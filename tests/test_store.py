@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+import datetime
+import socket
+import struct
+import pyzatt.misc as misc
+import pyzatt.pyzatt as pyzatt
+import pyzatt.zkmodules.defs as DEFS
+from pyzatt.store import ZKStore
+from tests.test_packet import device_replies, run_device
+from tests.test_datasets import make_users, att_record, fp_record
+
+"""
+Test script to check the local store of the device data, the replies of the
+device are simulated, so these tests don't require a device.
+"""
+
+
+def serial_reply():
+    return pyzatt.ZKSS().create_packet(
+        DEFS.CMD_ACK_OK, bytearray(b'~SerialNumber=ABC123\x00'))
+
+
+def status_reply(**counters):
+    status = bytearray(80)
+    for k, v in counters.items():
+        struct.pack_into('<I', status, DEFS.STATUS[k], v)
+    return pyzatt.ZKSS().create_packet(DEFS.CMD_ACK_OK, status)
+
+
+def with_size(entries):
+    return struct.pack('<I', len(entries)) + entries
+
+
+def test_sync():
+    users = make_users(5)
+    users_dataset = with_size(b''.join(u.ser_user() for u in users))
+    fps_dataset = with_size(b''.join(
+        fp_record(u.user_sn, 0, 1, bytes([u.user_sn]) * 300) for u in users))
+    t0 = datetime.datetime(2020, 3, 6, 8, 30, 0)
+    records = [(1, '1001', 1, t0 + datetime.timedelta(minutes=i), 0)
+               for i in range(30)]
+    op_dataset = with_size(struct.pack('<HHI4H', 0, 3, misc.encode_time_value(
+        t0), 1, 2, 3, 4))
+    counters = dict(user_count=5, fp_count=5, attlog_count=20, oplog_count=1)
+
+    store = ZKStore(':memory:')
+    z = pyzatt.ZKSS()
+    z.soc_zk, dev = socket.socketpair()
+
+    # first sync, every dataset is downloaded
+    th = run_device(dev, [serial_reply(), status_reply(**counters)] +
+                    device_replies(users_dataset, 1024) +
+                    device_replies(fps_dataset, 1024) +
+                    device_replies(with_size(b''.join(
+                        att_record(*r) for r in records[:20])), 1024) +
+                    device_replies(op_dataset, 1024))
+    assert all(store.sync(z).values())
+    th.join()
+
+    # new session, nothing changed on the device
+    z2 = pyzatt.ZKSS()
+    z2.soc_zk = z.soc_zk
+    th = run_device(dev, [serial_reply(), status_reply(**counters)])
+    assert not any(store.sync(z2).values())
+    th.join()
+    assert len(z2.users) == 5
+    assert z2.users[3].user_id == users[2].user_id
+    assert z2.users[3].fptmps[0] == [bytearray([3]) * 300, 1]
+    assert len(z2.att_log) == 20
+    assert z2.op_log[0].op_time == t0
+    assert z2.op_log[0].param4 == 4
+
+    # new attendance entries, only the log is downloaded and the new
+    # entries are appended to the stored log
+    counters['attlog_count'] = 30
+    th = run_device(dev, [serial_reply(), status_reply(**counters),
+                          status_reply(**counters)] +
+                    device_replies(with_size(b''.join(
+                        att_record(*r) for r in records)), 1024))
+    synced = store.sync(z2)
+    th.join()
+    assert synced == {'users': False, 'fptmps': False, 'att_log': True,
+                      'op_log': False}
+    assert [e.att_time for e in z2.att_log] == [r[3] for r in records]
+
+    dev.close()
+    z.soc_zk.close()
+    store.close()